@@ -0,0 +1,22 @@
+"""
+    Cart-pole with a moving target: CartPoleWobbleContinuousEnv-v0 in PyBullet, CartPoleWobbleNumpy-v0 in NumPy for
+    many lanes at once, and the vector environments that step them. Importing the package registers the Bullet
+    environment with gym, PyBullet itself is only loaded when one is made (or CartPoleWobbleContinuousEnv is used).
+"""
+
+from gym.envs.registration import registry, register
+
+from .cartpole_wobble_numpy import CartPoleWobbleVecEnv
+from .vec_env import DummyVecEnv, SubprocVecEnv, make_env, make_vec_env
+
+__all__ = ['CartPoleWobbleContinuousEnv', 'CartPoleWobbleVecEnv', 'DummyVecEnv', 'SubprocVecEnv', 'make_env', 'make_vec_env']
+
+if 'CartPoleWobbleContinuousEnv-v0' not in registry.env_specs:
+    register('CartPoleWobbleContinuousEnv-v0', entry_point='ECE239AS_Envs.cartpole_wobble_bullet:CartPoleWobbleContinuousEnv',
+             max_episode_steps=1000)
+
+def __getattr__(name):
+    if name == 'CartPoleWobbleContinuousEnv':
+        from .cartpole_wobble_bullet import CartPoleWobbleContinuousEnv
+        return CartPoleWobbleContinuousEnv
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,16 +1,19 @@
 
+import logging
+
 import numpy as np
 
-import gym
 from gym import spaces
-from gym.envs.registration import registry
 
 from pybullet_envs.bullet import CartPoleContinuousBulletEnv
 
 id = 'CartPoleWobbleContinuousEnv-v0'
+logger = logging.getLogger(__name__)
+
 class CartPoleWobbleContinuousEnv(CartPoleContinuousBulletEnv):
     def __init__(self, *args, **kwargs):
-        super().__init__(self, *args, **kwargs)
+        # Forward 'renders' so headless workers don't open a GUI window
+        super().__init__(*args, **kwargs)
 
         # Keep track of target location
         # self.target_pos = 0.5
@@ -29,18 +32,34 @@ class CartPoleWobbleContinuousEnv(CartPoleContinuousBulletEnv):
         self.observation_space = spaces.Box(-high, high, dtype=np.float32)
 
     def change_target(self):
-        self.target_pos = np.random.uniform(-self.x_threshold/2, self.x_threshold/2)
-        print('    Target: {:5}'.format(np.round(self.target_pos,2)), flush=True)
+        # Environment's own generator, so env.seed() also fixes the targets
+        self.target_pos = self.np_random.uniform(-self.x_threshold/2, self.x_threshold/2)
+        # Only formatted when debug logging is on
+        logger.debug('    Target: %5s', np.round(self.target_pos,2))
 
-    def step(self, action):
-        raw_state, reward, done, info = super().step(action)
+    def _observe(self, out=None):
+        # Observations are float32 like observation_space, written into 'out' when given
+        if out is None:
+            out = np.empty(5, dtype=np.float32)
+        # Element-wise, a slice assignment would first build a float64 array from the tuple
+        out[0], out[1], out[2], out[3] = self.state
+        out[4] = self.target_pos
+        return out
+
+    def step(self, action, out=None):
+        # Same physics step as CartPoleContinuousBulletEnv.step, without building its float64 copy of the state
+        p = self._p
+        p.setJointMotorControl2(self.cartpole, 0, p.TORQUE_CONTROL, force=action[0])
+        p.stepSimulation()
+        self.state = p.getJointState(self.cartpole, 1)[0:2] + p.getJointState(self.cartpole, 0)[0:2]
+        theta, theta_dot, x, x_dot = self.state
+        done = x < -self.x_threshold or x > self.x_threshold \
+            or theta < -self.theta_threshold_radians or theta > self.theta_threshold_radians
 
-        theta, theta_dot, x, x_dot = raw_state
-        # print(theta)
         # Check for target approach
         DEG_TO_RAD = (3.1415926 / 180.0)
-        x_good = np.abs(x - self.target_pos) < self.target_threshold
-        t_good = np.abs(theta) < 4 * DEG_TO_RAD #-theta < 2 * DEG_TO_RAD # Degrees to Radians
+        x_good = abs(x - self.target_pos) < self.target_threshold
+        t_good = abs(theta) < 4 * DEG_TO_RAD #-theta < 2 * DEG_TO_RAD # Degrees to Radians
         if done:
             reward = -self.target_reward
         elif x_good and t_good:
@@ -50,18 +69,28 @@ class CartPoleWobbleContinuousEnv(CartPoleContinuousBulletEnv):
             reward = 0
 
         # Package target into state
-        state = [*raw_state, self.target_pos]
+        return self._observe(out), reward, done, {}
 
-        return state, reward, done, info
+    def step_many(self, actions, out=None):
+        """
+            Apply 'actions' one step each, stopping early when the episode ends.
+            Returns the observations, rewards and dones of the steps taken, and the info of the last one.
+            Called through gym.make's TimeLimit wrapper these steps are not counted towards its limit.
+        """
+        actions = np.asarray(actions, dtype=np.float32).reshape(len(actions), -1)
+        states = np.empty((len(actions), 5), dtype=np.float32) if out is None else out
+        rewards = np.zeros(len(actions))
+        dones = np.zeros(len(actions), dtype=bool)
+        info = {}
+        steps = 0
+        for action in actions:
+            _, rewards[steps], dones[steps], info = self.step(action, out=states[steps])
+            steps += 1
+            if dones[steps - 1]: break
+        return states[:steps], rewards[:steps], dones[:steps], info
 
-    def reset(self):
-        state = super().reset()
+    def reset(self, out=None):
+        super().reset()
         self.change_target()
         # self.target_pos = 0.5
-        state = [*state, self.target_pos]
-        return state
-
-if not id in registry.env_specs:
-    gym.envs.registration.register(id,
-        entry_point='ECE239AS_Envs:CartPoleWobbleContinuousEnv',
-        max_episode_steps=1000)
+        return self._observe(out)
@@ -0,0 +1,122 @@
+import numpy as np
+
+from gym import spaces
+
+from .seeding import start_episode
+
+id = 'CartPoleWobbleNumpy-v0'
+
+class CartPoleWobbleVecEnv:
+    """
+        CartPoleWobbleContinuousEnv for 'num_envs' lanes at once, simulated in NumPy instead of Bullet.
+        Same interface as DummyVecEnv/SubprocVecEnv: finished lanes are reset automatically and their
+        final state is in info['terminal_observation']. Seeded the same way, lane i follows lane i of a
+        DummyVecEnv of the Bullet environment step for step (checked by 'python benchmark.py wobble').
+    """
+    # Bullet's cartpole.urdf, the pole's inertia is computed from its 0.05 x 0.05 x 1.0 collision box
+    gravity = 9.8
+    cart_mass = 1.0
+    pole_mass = 0.1
+    pole_com = 0.5
+    pole_inertia = pole_mass / 12 * (0.05**2 + 1.0**2)
+    time_step = 0.02
+
+    def __init__(self, num_envs=1, max_episode_steps=1000):
+        self.num_envs = num_envs
+        self.max_episode_steps = max_episode_steps
+
+        self.theta_threshold_radians = 12 * 2 * np.pi / 360
+        self.x_threshold = 2.4
+        self.target_threshold = 0.1
+        self.target_reward = 10
+        # Same constant as the Bullet version, so both agree on the boundary
+        self.theta_good = 4 * (3.1415926 / 180.0)
+
+        high = np.array([
+            self.x_threshold * 2, np.finfo(np.float32).max,
+            self.theta_threshold_radians * 2, np.finfo(np.float32).max,
+            self.x_threshold * 2
+        ])
+        self.observation_space = spaces.Box(-high, high, dtype=np.float32)
+        self.action_space = spaces.Box(-10 * np.ones(1), 10 * np.ones(1))
+
+        # Columns theta, theta_dot, x, x_dot, target, the observation layout of the Bullet version.
+        # Simulated in float64 like Bullet, observations are float32 like observation_space
+        self.state = np.zeros((num_envs, 5))
+        self.elapsed_steps = np.zeros(num_envs, dtype=int)
+        self.episodes = np.zeros(num_envs, dtype=int)
+        self.seed()
+
+    def seed(self, seed=None, episodes=None):
+        # One generator per lane seeded with seed + i, every episode starting at its own place in it (start_episode)
+        # as the vector environments do for Bullet. Drawn in the same order as the Bullet version (reset state, then target)
+        if seed is None:
+            seed = np.random.randint(2**31)
+        self.np_random = [np.random.default_rng(seed + i) for i in range(self.num_envs)]
+        self.seed_states = [rng.bit_generator.state for rng in self.np_random]
+        self.episodes[:] = 0 if episodes is None else episodes
+        return [[seed + i] for i in range(self.num_envs)]
+
+    def _reset_lane(self, i):
+        start_episode(self.np_random[i], self.seed_states[i], self.episodes[i])
+        self.episodes[i] += 1
+        self.state[i, :4] = self.np_random[i].uniform(low=-0.05, high=0.05, size=(4,))
+        self._change_target(i)
+        self.elapsed_steps[i] = 0
+
+    def _change_target(self, i):
+        self.state[i, 4] = self.np_random[i].uniform(-self.x_threshold/2, self.x_threshold/2)
+
+    def reset(self):
+        for i in range(self.num_envs):
+            self._reset_lane(i)
+        return self.state.astype(np.float32)
+
+    def step(self, actions):
+        force = np.asarray(actions, dtype=float).reshape(self.num_envs, -1)[:, 0]
+        theta, theta_dot, x, x_dot = self.state[:, 0], self.state[:, 1], self.state[:, 2], self.state[:, 3]
+
+        # Cart and pole equations of motion, the 2x2 mass matrix solved in closed form
+        cos, sin = np.cos(theta), np.sin(theta)
+        total_mass = self.cart_mass + self.pole_mass
+        coupling = self.pole_mass * self.pole_com * cos
+        pole_moment = self.pole_inertia + self.pole_mass * self.pole_com**2
+        cart_force = force + self.pole_mass * self.pole_com * sin * theta_dot**2
+        pole_torque = self.pole_mass * self.gravity * self.pole_com * sin
+        det = total_mass * pole_moment - coupling**2
+        x_acc = (pole_moment * cart_force - coupling * pole_torque) / det
+        theta_acc = (total_mass * pole_torque - coupling * cart_force) / det
+
+        # Semi-implicit Euler like Bullet: velocities first, positions from the new velocities (in place)
+        x_dot += x_acc * self.time_step
+        theta_dot += theta_acc * self.time_step
+        x += x_dot * self.time_step
+        theta += theta_dot * self.time_step
+        self.elapsed_steps += 1
+
+        dones = (np.abs(x) > self.x_threshold) | (np.abs(theta) > self.theta_threshold_radians)
+        reached = ~dones & (np.abs(x - self.state[:, 4]) < self.target_threshold) & (np.abs(theta) < self.theta_good)
+        rewards = self.target_reward * (reached.astype(float) - dones)
+        for i in np.flatnonzero(reached):
+            self._change_target(i)
+
+        # Time limit of the registered Bullet environment
+        truncated = ~dones & (self.elapsed_steps >= self.max_episode_steps)
+        dones |= truncated
+
+        states = self.state.astype(np.float32)
+        infos = [{} for _ in range(self.num_envs)]
+        for i in np.flatnonzero(dones):
+            infos[i]['terminal_observation'] = states[i].copy()
+            if self.elapsed_steps[i] >= self.max_episode_steps:
+                infos[i]['TimeLimit.truncated'] = bool(truncated[i])
+            self._reset_lane(i)
+            states[i] = self.state[i]
+        return states, rewards, dones, infos
+
+    def render(self):
+        # Nothing to show without Bullet
+        return None
+
+    def close(self):
+        pass
@@ -0,0 +1,8 @@
+# Draws an episode may use before it would run into the next one
+episode_stride = 1 << 64
+
+def start_episode(rng, seed_state, episode):
+    # Move 'rng' to the start of episode number 'episode' of the stream seeded to 'seed_state'. PCG64 jumps there
+    # directly, so any episode can be started (a resumed run restarts the episode it was in) without replaying the rest
+    rng.bit_generator.state = seed_state
+    rng.bit_generator.advance(int(episode) * episode_stride)
@@ -0,0 +1,170 @@
+import importlib
+import multiprocessing as mp
+import signal
+
+import numpy as np
+import gym
+
+from .cartpole_wobble_numpy import CartPoleWobbleVecEnv, id as numpy_id
+from .seeding import start_episode
+
+def make_env(env_id, **env_kwargs):
+    # PyBullet's own environments (envs_pyb) are registered by importing pybullet_envs, only loaded for them.
+    # Imported for that side effect only
+    if env_id not in gym.envs.registry.env_specs:
+        importlib.import_module('pybullet_envs')
+    return gym.make(env_id, **env_kwargs)
+
+def _worker(remote, parent_remote, env_id, env_kwargs):
+    parent_remote.close()
+    # Ctrl-C is handled by the main process, which closes the workers itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Spawned workers start from a clean interpreter, importing this package registers the envs
+    env = make_env(env_id, **env_kwargs)
+    # Seeded generator state and number of the next episode, once seeded every episode starts at its own place
+    seed_state, episode = None, 0
+    def reset():
+        nonlocal episode
+        if seed_state is not None:
+            start_episode(env.unwrapped.np_random, seed_state, episode)
+            episode += 1
+        return env.reset()
+    try:
+        while True:
+            cmd, data = remote.recv()
+            if cmd == 'step':
+                state, reward, done, info = env.step(data)
+                # Auto-reset so the lane never stalls, but keep the real final state
+                if done:
+                    info['terminal_observation'] = state
+                    state = reset()
+                remote.send((state, reward, done, info))
+            elif cmd == 'reset':
+                remote.send(reset())
+            elif cmd == 'seed':
+                seed, episode = data
+                result = env.seed(seed)
+                seed_state = env.unwrapped.np_random.bit_generator.state
+                remote.send(result)
+            elif cmd == 'render':
+                remote.send(env.render())
+            elif cmd == 'spaces':
+                remote.send((env.observation_space, env.action_space))
+            elif cmd == 'close':
+                break
+    finally:
+        env.close()
+        remote.close()
+
+class DummyVecEnv:
+    """
+        Steps 'num_envs' environments in this process, same interface as SubprocVecEnv
+    """
+    def __init__(self, env_id, num_envs=1, **env_kwargs):
+        self.envs = [make_env(env_id, **env_kwargs) for _ in range(num_envs)]
+        self.num_envs = num_envs
+        self.observation_space = self.envs[0].observation_space
+        self.action_space = self.envs[0].action_space
+        self.seed_states = None
+        self.episodes = np.zeros(num_envs, dtype=int)
+
+    def _reset(self, i):
+        if self.seed_states is not None:
+            start_episode(self.envs[i].unwrapped.np_random, self.seed_states[i], self.episodes[i])
+            self.episodes[i] += 1
+        return self.envs[i].reset()
+
+    def reset(self):
+        return np.array([self._reset(i) for i in range(self.num_envs)])
+
+    def seed(self, seed, episodes=None):
+        # Lane i gets seed + i, every episode starts at its own place in that stream (start_episode),
+        # the next reset starts episode number 'episodes[i]'
+        results = [env.seed(seed + i) for i, env in enumerate(self.envs)]
+        self.seed_states = [env.unwrapped.np_random.bit_generator.state for env in self.envs]
+        self.episodes[:] = 0 if episodes is None else episodes
+        return results
+
+    def step(self, actions):
+        # Written lane by lane into arrays of the observation space's dtype
+        states = np.empty((self.num_envs,) + self.observation_space.shape, dtype=self.observation_space.dtype)
+        rewards = np.empty(self.num_envs)
+        dones = np.empty(self.num_envs, dtype=bool)
+        infos = []
+        for i, (env, action) in enumerate(zip(self.envs, actions)):
+            state, rewards[i], dones[i], info = env.step(action)
+            if dones[i]:
+                info['terminal_observation'] = state
+                state = self._reset(i)
+            states[i] = state
+            infos.append(info)
+        return states, rewards, dones, infos
+
+    def render(self):
+        # Only the first lane is ever shown
+        return self.envs[0].render()
+
+    def close(self):
+        for env in self.envs:
+            env.close()
+
+class SubprocVecEnv:
+    """
+        Steps 'num_envs' environments in parallel, one worker process per environment.
+        Finished lanes are reset automatically, their final state is in info['terminal_observation'].
+    """
+    def __init__(self, env_id, num_envs, start_method='spawn', **env_kwargs):
+        ctx = mp.get_context(start_method)
+        self.num_envs = num_envs
+        self.remotes, self.work_remotes = zip(*[ctx.Pipe() for _ in range(num_envs)])
+        self.processes = []
+        for remote, work_remote in zip(self.remotes, self.work_remotes):
+            args = (work_remote, remote, env_id, env_kwargs)
+            process = ctx.Process(target=_worker, args=args, daemon=True)
+            process.start()
+            self.processes.append(process)
+            work_remote.close()
+
+        self.remotes[0].send(('spaces', None))
+        self.observation_space, self.action_space = self.remotes[0].recv()
+        self.closed = False
+
+    def reset(self):
+        for remote in self.remotes:
+            remote.send(('reset', None))
+        return np.array([remote.recv() for remote in self.remotes])
+
+    def seed(self, seed, episodes=None):
+        # Same seeds and episode starts as DummyVecEnv
+        for i, remote in enumerate(self.remotes):
+            remote.send(('seed', (seed + i, 0 if episodes is None else int(episodes[i]))))
+        return [remote.recv() for remote in self.remotes]
+
+    def step(self, actions):
+        # Send every action before waiting on any result so the workers run concurrently
+        for remote, action in zip(self.remotes, actions):
+            remote.send(('step', action))
+        states, rewards, dones, infos = zip(*[remote.recv() for remote in self.remotes])
+        return np.array(states), np.array(rewards, dtype=float), np.array(dones), list(infos)
+
+    def render(self):
+        self.remotes[0].send(('render', None))
+        return self.remotes[0].recv()
+
+    def close(self):
+        if self.closed: return
+        for remote in self.remotes:
+            remote.send(('close', None))
+        for process in self.processes:
+            process.join()
+        self.closed = True
+
+def make_vec_env(env_id, num_envs=1, **env_kwargs):
+    # The NumPy cart-pole steps every lane in one call, no worker processes needed
+    if env_id == numpy_id:
+        return CartPoleWobbleVecEnv(num_envs, **env_kwargs)
+    # A single environment stays in-process so rendering works as before. Daemonic processes (sweep and
+    # evaluate pool workers) are not allowed children, their lanes are stepped in-process as well
+    if num_envs == 1 or mp.current_process().daemon:
+        return DummyVecEnv(env_id, num_envs, **env_kwargs)
+    return SubprocVecEnv(env_id, num_envs, **env_kwargs)
@@ -0,0 +1,930 @@
+"""
+    Networks, exploration noise and the training algorithms DDPG, TD3, FusedTD3 and HIRO.
+    Every algorithm is built from explicit sizes and hyperparameters and owns its replay buffers (buffers.py),
+    training.py puts them together from a TrainConfig.
+    The following code draws from this blog: https://keras.io/examples/rl/ddpg_pendulum/
+"""
+
+import logging
+from functools import partial
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import layers
+
+from buffers import Buffer, segment_buffer_types
+from seeding import make_rng, seed_int
+from profiling import profiler
+
+logger = logging.getLogger(__name__)
+
+class StepTrigger:
+    """
+        Activate 'num' times out of 'every' steps
+    """
+    def __init__(self, every, num=1):
+        self.counter = 0
+        self.max = every
+
+        if every < num:
+            raise Exception("StepTrigger: invalid value (num must be <= every)")
+
+        # 0 should always be part of the active set
+        self.active_set = set([0])
+        out = every - num
+        num -= 1
+
+        # Add 'num' instances to 'active_set'
+        for i in range(1, every):
+            if num > out:
+                self.active_set.add(i)
+                num -= 1
+            else:
+                out -= 1
+
+    def reset(self):
+        self.counter = 0
+
+    def step(self):
+        self.counter += 1
+        if self.counter == self.max:
+            self.counter = 0
+
+    def active(self):
+        return self.counter in self.active_set
+
+class Bounds:
+    def __init__(self, lower, upper):
+        if upper < lower:
+            lower, upper = upper, lower
+        self.lower = lower
+        self.upper = upper
+    def __call__(self, values, out=None):
+        return np.clip(values, self.lower, self.upper, out=out)
+
+class OUActionNoise:
+    """
+        One Ornstein-Uhlenbeck process per element of 'mean', shape (num_envs, num_actions) for a bank of lanes.
+        Normal samples are drawn 'block' steps at a time. end_episodes() resets finished lanes (if 'reset_on_done')
+        and decays the shared std_dev once per finished episode: std_dev * decay ('exponential') or std_dev - decay
+        ('linear'), never below min_std_dev.
+    """
+    def __init__(self, mean, std_deviation, theta=0.15, dt=1e-2, x_initial=None, block=256,
+                 decay=None, min_std_dev=0.0, schedule='exponential', reset_on_done=False):
+        self.theta = theta
+        self.mean = mean
+        self.std_dev = std_deviation
+        self.dt = dt
+        self.x_initial = x_initial
+        self.decay = decay
+        self.min_std_dev = min_std_dev
+        self.schedule = schedule
+        self.reset_on_done = reset_on_done
+        self.rng = make_rng('noise')
+        self._normal = np.zeros(np.shape(mean))
+        self._drift = np.zeros(np.shape(mean))
+        # Pre-generated samples, the same stream as drawing them one step at a time
+        self._block = np.zeros((block,) + np.shape(mean))
+        self._index = block
+        self._block_state = self.rng.bit_generator.state
+        self.x_prev = np.zeros(np.shape(mean))
+        self.reset()
+
+    def _next_normal(self):
+        if self._index == len(self._block):
+            self._block_state = self.rng.bit_generator.state
+            self.rng.standard_normal(out=self._block)
+            self._index = 0
+        self._index += 1
+        return self._block[self._index - 1]
+
+    def __call__(self):
+        # Formula taken from https://www.wikipedia.org/wiki/Ornstein-Uhlenbeck_process.
+        # x = x_prev + theta * (mean - x_prev) * dt + std_dev * sqrt(dt) * N(0, 1), computed in place
+        np.subtract(self.mean, self.x_prev, out=self._drift)
+        self._drift *= self.theta * self.dt
+        self.x_prev += self._drift
+        np.multiply(self._next_normal(), self.std_dev * np.sqrt(self.dt), out=self._normal)
+        self.x_prev += self._normal
+        # Makes next noise dependent on current one, the returned array is updated by the next call
+        return self.x_prev
+
+    def reset(self, lanes=None):
+        # Every lane, or only the given lanes (indices or a boolean mask over the first axis)
+        initial = np.broadcast_to(0.0 if self.x_initial is None else np.asarray(self.x_initial, dtype=float), self.x_prev.shape)
+        if lanes is None:
+            np.copyto(self.x_prev, initial)
+        else:
+            self.x_prev[lanes] = initial[lanes]
+
+    def end_episodes(self, lanes):
+        # Called with the lanes whose episode just finished
+        lanes = np.asarray(lanes)
+        count = np.count_nonzero(lanes) if lanes.dtype == bool else lanes.size
+        if count == 0:
+            return
+        if self.reset_on_done:
+            self.reset(lanes)
+        if self.decay is not None:
+            if self.schedule == 'linear':
+                self.std_dev = np.maximum(self.min_std_dev, self.std_dev - self.decay * count)
+            else:
+                self.std_dev = np.maximum(self.min_std_dev, self.std_dev * self.decay**count)
+
+    # Checkpointed state, copies so a background write never sees later updates.
+    # Inside a block the generator state is the one the block was drawn from, the block is redrawn on restore.
+    # A used-up block is not needed again, the live state is where the next block starts
+    def get_state(self):
+        rng = self._block_state if self._index < len(self._block) else self.rng.bit_generator.state
+        return {'x_prev': self.x_prev.copy(), 'std_dev': np.copy(self.std_dev), 'rng': rng, 'index': self._index}
+
+    def set_state(self, state):
+        np.copyto(self.x_prev, state['x_prev'])
+        self.std_dev = state['std_dev']
+        self.rng.bit_generator.state = state['rng']
+        self._block_state = state['rng']
+        self._index = state.get('index', len(self._block))
+        if self._index < len(self._block):
+            self.rng.standard_normal(out=self._block)
+
+# This update target parameters slowly
+# Based on rate `tau`, which is much less than one.
+@tf.function
+def update_target(target_weights, weights, tau):
+    for (a, b) in zip(target_weights, weights):
+        a.assign(b * tau + a * (1 - tau))
+
+def get_actor(num_states, num_actions, units=32, upper_bound=1.0):
+    # Initialize weights between -3e-3 and 3-e3
+    last_init = tf.random_uniform_initializer(minval=-0.003, maxval=0.003)
+
+    inputs = layers.Input(shape=(num_states,))
+    out = layers.Dense(units, activation="relu")(inputs)
+    out = layers.Dense(units, activation="relu")(out)
+    outputs = layers.Dense(num_actions, activation="tanh", kernel_initializer=last_init)(out)
+
+    # Our upper bound is 2.0 for Pendulum.
+    outputs = outputs * upper_bound
+    model = tf.keras.Model(inputs, outputs)
+    return model
+
+def get_critic(num_states, num_actions, units=32):
+    # State as input
+    state_input = layers.Input(shape=(num_states))
+    state_out = layers.Dense(16, activation="relu")(state_input)
+    state_out = layers.Dense(32, activation="relu")(state_out)
+
+    # Action as input
+    action_input = layers.Input(shape=(num_actions))
+    action_out = layers.Dense(32, activation="relu")(action_input)
+
+    # Both are passed through seperate layer before concatenating
+    concat = layers.Concatenate()([state_out, action_out])
+
+    out = layers.Dense(units, activation="relu")(concat)
+    out = layers.Dense(units, activation="relu")(out)
+    outputs = layers.Dense(1)(out)
+
+    # Outputs single value for give state-action
+    model = tf.keras.Model([state_input, action_input], outputs)
+
+    return model
+
+class StackedDense(layers.Layer):
+    """
+        Dense layer with an independent kernel per ensemble member.
+        Inputs are shaped (members, batch, features) and all members run in one batched matmul.
+    """
+    def __init__(self, units, members=2, activation=None, **kwargs):
+        super().__init__(**kwargs)
+        self.units = units
+        self.members = members
+        self.activation = tf.keras.activations.get(activation)
+
+    def build(self, input_shape):
+        fan_in = int(input_shape[-1])
+        # Same Glorot scale a plain Dense layer would get, drawn independently per member
+        glorot = lambda shape, dtype=None: tf.stack(
+            [tf.keras.initializers.GlorotUniform()(shape[1:], dtype) for _ in range(shape[0])])
+        self.kernel = self.add_weight('kernel', shape=(self.members, fan_in, self.units), initializer=glorot)
+        self.bias = self.add_weight('bias', shape=(self.members, 1, self.units), initializer='zeros')
+
+    def call(self, inputs):
+        return self.activation(tf.matmul(inputs, self.kernel) + self.bias)
+
+class TwinCritic(tf.keras.Model):
+    """
+        Both TD3 critics as one stacked network (same layout as get_critic), output shaped (batch, 2)
+    """
+    def __init__(self, num_states, num_actions, units=32, members=2):
+        super().__init__()
+        self.members = members
+        self.state_layers = [StackedDense(16, members, "relu"), StackedDense(32, members, "relu")]
+        self.action_layer = StackedDense(32, members, "relu")
+        self.out_layers = [StackedDense(units, members, "relu"), StackedDense(units, members, "relu"),
+                           StackedDense(1, members)]
+        # Create the weights now so targets can copy them
+        self([tf.zeros((1, num_states)), tf.zeros((1, num_actions))])
+
+    def call(self, inputs, training=None):
+        states, actions = inputs
+        # Every member sees the same batch
+        state_out = tf.tile(tf.expand_dims(tf.cast(states, tf.float32), 0), [self.members, 1, 1])
+        action_out = tf.tile(tf.expand_dims(tf.cast(actions, tf.float32), 0), [self.members, 1, 1])
+        for layer in self.state_layers:
+            state_out = layer(state_out)
+        out = tf.concat([state_out, self.action_layer(action_out)], -1)
+        for layer in self.out_layers:
+            out = layer(out)
+        return tf.transpose(tf.squeeze(out, -1))
+
+class DDPG:
+    def __init__(self, num_states, num_actions, action_bound, actor_lr=0.001, critic_lr=0.002, gamma=0.99, tau=0.005, buffer_size=500_000, buffer_cls=None,
+                 actor_units=32, critic_units=32):
+        self.action_bound = action_bound
+        # Hidden layer widths (ActorNN/CriticNN on the command line)
+        self.actor_units = actor_units
+        self.critic_units = critic_units
+
+        # Create set of actor networks
+        self.actor = get_actor(num_states, num_actions, actor_units, action_bound.upper)
+        self.actor.optim = tf.keras.optimizers.Adam(actor_lr)
+        self.target_actor = get_actor(num_states, num_actions, actor_units, action_bound.upper)
+        self.target_actor.set_weights(self.actor.get_weights())
+
+        # Create set of critic networks
+        self.critic = self._build_critic(num_states, num_actions)
+        self.critic.optim = tf.keras.optimizers.Adam(critic_lr)
+        self.target_critic = self._build_critic(num_states, num_actions)
+        self.target_critic.set_weights(self.critic.get_weights())
+
+        # Training parameters
+        self.gamma = gamma
+        self.tau = tau
+
+        # Replay storage, see 'buffer_types' for the available layouts
+        buffer_cls = buffer_cls or Buffer
+        self.buffer = buffer_cls(num_states, num_actions, buffer_size, 64)
+
+        self.num_states = num_states
+        self.num_actions = num_actions
+        self.compile_learner()
+        self.compile_policy()
+
+    def _build_critic(self, num_states, num_actions):
+        return get_critic(num_states, num_actions, self.critic_units)
+
+    def compile_policy(self, jit_compile=False):
+        # Inference only, one trace for any number of lanes
+        spec = tf.TensorSpec((None, self.num_states), tf.float32)
+        self._act_fn = tf.function(lambda states: self.actor(states, training=False),
+                                   jit_compile=jit_compile, input_signature=[spec])
+        self._obs = np.zeros((1, self.num_states), dtype=np.float32)
+
+    def _observe(self, states):
+        # Reused float32 copy of the observations, reallocated only when the number of lanes changes
+        if len(self._obs) != len(states):
+            self._obs = np.zeros((len(states), self.num_states), dtype=np.float32)
+        np.copyto(self._obs, states)
+        return self._obs
+
+    def policy(self, state, noise_object):
+        action = self.policy_batch(np.reshape(state, (1,-1)), noise_object)
+        return [np.squeeze(action[0])]
+
+    def policy_batch(self, states, noise_object, pretrain=False):
+        # One graph call for every environment lane, 'pretrain' only matters to HIRO
+        actions = self._act_fn(self._observe(states)).numpy()
+        # noise_object must hold one state per lane, shape (num_envs, num_actions)
+        actions += noise_object()
+        # We make sure actions are within bounds
+        return self.action_bound(actions, out=actions)
+
+    def record(self, prev_state, action, reward, state, done):
+        self.buffer.record((prev_state, action, reward, state, 0.0 if done else 1.0))
+
+    def record_batch(self, prev_states, actions, rewards, states, dones):
+        rewards = np.reshape(rewards, (-1, 1))
+        not_dones = 1.0 - np.reshape(dones, (-1, 1)).astype(float)
+        with profiler.stage('buffer.record'):
+            self.buffer.record_batch((prev_states, actions, rewards, states, not_dones))
+
+    # Get predicted actions that target network would make
+    def _get_target_actions(self, states, training):
+        return self.target_actor(states, training=training)
+
+    # Evaluate target critic network
+    def _get_target_values(self, states, actions):
+        return self.target_critic([states, actions], training=True)
+
+    # Update target networks to approach current networks
+    def _blend_targets(self):
+        update_target(self.target_actor.variables, self.actor.variables, self.tau)
+        update_target(self.target_critic.variables, self.critic.variables, self.tau)
+
+    def update_targets(self):
+        self._blend_targets()
+
+    def save(self, path):
+        # 'path' is the run folder from make_run_dir, per-episode results are already in its metrics log
+        print('Saving model to', path)
+
+        # Write models to directory
+        self.save_models(path)
+
+        # Return path so child classes can use it
+        return path
+
+    def save_models(self, path):
+        self.actor.save(f'{path}/actor')
+        self.critic.save(f'{path}/critic')
+
+    # TensorFlow state for checkpoints: networks, targets and optimizers
+    def trackables(self):
+        return dict(actor=self.actor, critic=self.critic, target_actor=self.target_actor, target_critic=self.target_critic,
+                    actor_optimizer=self.actor.optim, critic_optimizer=self.critic.optim)
+
+    # Optimizer slots are created on the first update, a restore needs them to exist already
+    def build_optimizers(self):
+        self.actor.optim.build(self.actor.trainable_variables)
+        self.critic.optim.build(self.critic.trainable_variables)
+
+    # Replay buffers by name, checkpoints write only their rows added since the previous checkpoint
+    def buffers(self):
+        return {'buffer': self.buffer}
+
+    # Remaining Python-side training state
+    def get_state(self):
+        return {}
+
+    def set_state(self, state):
+        pass
+
+    # Eager execution is turned on by default in TensorFlow 2. Wrapping with tf.function allows
+    # TensorFlow to build a static graph out of the logic and computations in our function.
+    # This provides a large speed up for blocks of code that contain many small TensorFlow operations such as this one.
+    def compile_learner(self, jit_compile=False):
+        # Fixed float32 signature: every batch matches the single trace, whatever buffer produced it
+        rows = lambda width: tf.TensorSpec((None, width), tf.float32)
+        batch_spec = {'states': rows(self.num_states), 'actions': rows(self.num_actions), 'rewards': rows(1),
+                      'next_states': rows(self.num_states), 'dones': rows(1), 'weights': rows(1)}
+        self.trace_count = 0
+        self._learn_fn = tf.function(self._learn_step, jit_compile=jit_compile,
+                                     input_signature=[batch_spec, tf.TensorSpec((), tf.bool)])
+        self._skip_flags = tf.constant(False), tf.constant(True)
+
+        # Super-batches add a leading (num_batches,) dimension, flags are given per update
+        batches_spec = {key: tf.TensorSpec((None,) + spec.shape, spec.dtype) for key, spec in batch_spec.items()}
+        flags_spec = tf.TensorSpec((None,), tf.bool)
+        self._learn_many_fn = tf.function(self._learn_many, jit_compile=jit_compile,
+                                          input_signature=[batches_spec, flags_spec, flags_spec])
+
+    def learn(self, batch, skip_actor=False):
+        return self._learn_fn(batch, self._skip_flags[bool(skip_actor)])
+
+    def learn_many(self, batches, skip_actor, update_targets):
+        return self._learn_many_fn(batches, skip_actor, update_targets)
+
+    def _learn_many(self, batches, skip_actor, update_targets):
+        # Sequential updates in one graph call, autograph turns the loop into a tf.while_loop
+        num_batches = tf.shape(skip_actor)[0]
+        td_errors = tf.TensorArray(tf.float32, size=num_batches)
+        for k in tf.range(num_batches):
+            batch = {key: value[k] for key, value in batches.items()}
+            y, errors = self._learn_step(batch, skip_actor[k])
+            if update_targets[k]:
+                self._blend_targets()
+            td_errors = td_errors.write(k, errors)
+        return td_errors.stack()
+
+    def _learn_step(self, batch, skip_actor):
+        # Python side effects only run while tracing, so this counts (re)traces
+        self.trace_count += 1
+
+        # Extract batches from batch dict
+        keys = 'states', 'actions', 'rewards', 'next_states', 'dones'
+        states, actions, rewards, next_states, dones = [batch[key] for key in keys]
+
+        # Get Q-values of next_states (using target actor actions)
+        target_actions = self._get_target_actions(next_states, training=True)
+        y = rewards + dones * self.gamma * self._get_target_values(next_states, target_actions)
+
+        # Importance-sampling weights from prioritized replay, ones for uniform buffers
+        weights = batch['weights']
+
+        # Regress critic_model toward targets
+        with tf.GradientTape() as tape:
+            critic_value = self.critic([states, actions], training=True)
+            td_errors = y - critic_value
+            critic_loss = tf.math.reduce_mean(weights * tf.math.square(td_errors))
+
+        critic_grad = tape.gradient(critic_loss, self.critic.trainable_variables)
+        self.critic.optim.apply_gradients(
+            zip(critic_grad, self.critic.trainable_variables)
+        )
+
+
+        # Skip_actor: DO NOT update actor
+        if not skip_actor:
+            # TD3-NOTE: Still use critic_model (1) to optimize policy.
+            with tf.GradientTape() as tape:
+                actor_actions = self.actor(states, training=True)
+                critic_value = self.critic([states, actor_actions], training=True)
+                # Used `-value` as we want to maximize the value given
+                # by the critic for our actions
+                actor_loss = -tf.math.reduce_mean(critic_value)
+
+            actor_grad = tape.gradient(actor_loss, self.actor.trainable_variables)
+            self.actor.optim.apply_gradients(
+                zip(actor_grad, self.actor.trainable_variables)
+            )
+        return y, td_errors
+
+    def train(self):
+        with profiler.stage('get_batch'):
+            experiences = self.buffer.get_batch()
+        with profiler.stage('learn'):
+            y, td_errors = self.learn(experiences)
+        # Only prioritized buffers use the TD errors
+        with profiler.stage('priorities'):
+            self.buffer.update_priorities(td_errors)
+        with profiler.stage('update_targets'):
+            self.update_targets()
+
+    # (skip_actor, update_targets) flags of the next 'num_batches' updates, in the order train() runs them
+    def _schedule(self, num_batches):
+        return np.zeros(num_batches, dtype=bool), np.ones(num_batches, dtype=bool)
+
+    # Same as calling train() 'num_batches' times, with one sample and one graph call
+    def train_many(self, num_batches):
+        with profiler.stage('get_batch'):
+            experiences = self.buffer.get_batches(num_batches)
+        # Target updates run inside the same graph call
+        with profiler.stage('learn'):
+            td_errors = self.learn_many(experiences, *self._schedule(num_batches))
+        # Priorities of the whole super-batch are refreshed after its last update
+        with profiler.stage('priorities'):
+            self.buffer.update_priorities(td_errors)
+
+class TD3(DDPG):
+    def __init__(self, num_states, num_actions, action_bound, actor_lr=0.001, critic_lr=0.002, gamma=0.99, tau=0.005, buffer_cls=None,
+                 actor_units=32, critic_units=32):
+        super().__init__(num_states, num_actions, action_bound, actor_lr, critic_lr, gamma, tau, buffer_cls=buffer_cls,
+                         actor_units=actor_units, critic_units=critic_units)
+
+        self.critic2 = self._build_critic(num_states, num_actions)
+        self.critic2.optim = tf.keras.optimizers.Adam(critic_lr)
+        self.target_critic2 = self._build_critic(num_states, num_actions)
+        self.target_critic2.set_weights(self.critic2.get_weights())
+
+        self.action_noise = 0.05 #0.01 #0.1
+        # Counter-based generator, its state is a variable saved with the networks
+        self.target_noise = tf.random.Generator.from_seed(seed_int('target_noise'))
+        # Read when learn is traced, fixed after construction
+        self.minimize_target_values = True
+
+        self.update_trigger = StepTrigger(every=4, num=2)
+
+    def _get_target_actions(self, states, training=True):
+        # Start with the same target actions as DDPG algorithm
+        DDPG_target_actions = super()._get_target_actions(states, training)
+        shape = tf.shape(DDPG_target_actions)
+        # Add mean-0 noise
+        action_noise =  self.target_noise.normal(shape, stddev=self.action_noise) #05) #0.01)
+        return DDPG_target_actions + action_noise
+
+    def _get_target_values(self, states, actions):
+        # Get Q-values from DDPG
+        DDPG_values = super()._get_target_values(states, actions)
+        if not self.minimize_target_values:
+            return DDPG_values
+        else:
+            # Calculate Q-values according to second critic network
+            critic2_values = self.target_critic2([states, actions], training=True)
+            # Return minimum (to help prevent Q-value overestimatino)
+            return tf.math.minimum(DDPG_values, critic2_values)
+
+    def _blend_targets(self):
+        super()._blend_targets()
+        update_target(self.target_critic2.variables, self.critic2.variables, self.tau)
+
+    def update_targets(self):
+        # Return early if update trigger is not active
+        if not self.update_trigger.active(): return
+        self._blend_targets()
+
+    def save_models(self, path):
+        super().save_models(path)
+        self.critic2.save(f'{path}/critic2')
+
+    def trackables(self):
+        return dict(super().trackables(), critic2=self.critic2, target_critic2=self.target_critic2,
+                    critic2_optimizer=self.critic2.optim, target_noise=self.target_noise)
+
+    def build_optimizers(self):
+        super().build_optimizers()
+        self.critic2.optim.build(self.critic2.trainable_variables)
+
+    def get_state(self):
+        return {'update_trigger': self.update_trigger.counter}
+
+    def set_state(self, state):
+        self.update_trigger.counter = state['update_trigger']
+
+    def _learn_step(self, batch, skip_actor):
+        # Update critic and maybe actor
+        y, td_errors = super()._learn_step(batch, skip_actor)
+
+        # Update critic2
+        with tf.GradientTape() as tape:
+            critic_value = self.critic2([batch['states'], batch['actions']], training=True)
+            critic_loss = tf.math.reduce_mean(batch['weights'] * tf.math.square(y - critic_value))
+        critic_grad = tape.gradient(critic_loss, self.critic2.trainable_variables)
+        self.critic2.optim.apply_gradients(zip(critic_grad, self.critic2.trainable_variables))
+        return y, td_errors
+
+    def train(self):
+        with profiler.stage('get_batch'):
+            experiences = self.buffer.get_batch()
+        # The actor schedule is stepped here in Python, learn only sees the resulting flag
+        with profiler.stage('learn'):
+            y, td_errors = self.learn(experiences, not self.update_trigger.active())
+        with profiler.stage('priorities'):
+            self.buffer.update_priorities(td_errors)
+        self.update_trigger.step()
+        with profiler.stage('update_targets'):
+            self.update_targets()
+
+    def _schedule(self, num_batches):
+        skip_actor, update_targets = [], []
+        for _ in range(num_batches):
+            skip_actor.append(not self.update_trigger.active())
+            self.update_trigger.step()
+            update_targets.append(self.update_trigger.active())
+        return np.array(skip_actor), np.array(update_targets)
+
+class FusedTD3(TD3):
+    """
+        TD3 where a training step is a single graph call: both critics are one TwinCritic trained in one tape,
+        the delayed actor schedule is driven by a TF step variable, and the targets are blended in the same call.
+    """
+    def __init__(self, num_states, num_actions, action_bound, actor_lr=0.001, critic_lr=0.002, gamma=0.99, tau=0.005, buffer_cls=None,
+                 actor_units=32, critic_units=32):
+        # Skip TD3.__init__, critic2 lives inside the twin critic
+        DDPG.__init__(self, num_states, num_actions, action_bound, actor_lr, critic_lr, gamma, tau, buffer_cls=buffer_cls,
+                      actor_units=actor_units, critic_units=critic_units)
+
+        self.action_noise = 0.05
+        self.target_noise = tf.random.Generator.from_seed(seed_int('target_noise'))
+        self.minimize_target_values = True
+
+        # Same actor/target schedule as TD3, looked up in the graph instead of in Python
+        self.update_trigger = StepTrigger(every=4, num=2)
+        self.update_schedule = tf.constant([i in self.update_trigger.active_set for i in range(self.update_trigger.max)])
+        self.train_step = tf.Variable(0, dtype=tf.int64, trainable=False)
+
+        self.sources = self.actor.variables + self.critic.variables
+        self.targets = self.target_actor.variables + self.target_critic.variables
+        self._blend_targets_fn = tf.function(self._blend_targets)
+
+    def _build_critic(self, num_states, num_actions):
+        return TwinCritic(num_states, num_actions, self.critic_units)
+
+    def _get_target_values(self, states, actions):
+        # Minimum over the twin target critics (to help prevent Q-value overestimation)
+        return tf.math.reduce_min(self.target_critic([states, actions], training=True), axis=1, keepdims=True)
+
+    def _blend_targets(self):
+        # Polyak average over all target weights at once as one flat vector
+        sources = tf.concat([tf.reshape(v, [-1]) for v in self.sources], 0)
+        targets = tf.concat([tf.reshape(v, [-1]) for v in self.targets], 0)
+        blended = targets + self.tau * (sources - targets)
+        sizes = [int(np.prod(v.shape)) for v in self.targets]
+        for v, part in zip(self.targets, tf.split(blended, sizes)):
+            v.assign(tf.reshape(part, v.shape))
+
+    def update_targets(self):
+        # Normally done inside learn
+        self._blend_targets_fn()
+
+    def save_models(self, path):
+        DDPG.save_models(self, path)
+
+    # The actor schedule position is a TF variable, checkpointed with the networks
+    def trackables(self):
+        return dict(DDPG.trackables(self), train_step=self.train_step, target_noise=self.target_noise)
+
+    def build_optimizers(self):
+        DDPG.build_optimizers(self)
+
+    def _learn_step(self, batch, skip_actor):
+        # skip_actor is ignored, the schedule lives in the graph
+        self.trace_count += 1
+
+        keys = 'states', 'actions', 'rewards', 'next_states', 'dones', 'weights'
+        states, actions, rewards, next_states, dones, weights = [batch[key] for key in keys]
+
+        target_actions = self._get_target_actions(next_states, training=True)
+        y = rewards + dones * self.gamma * self._get_target_values(next_states, target_actions)
+
+        # Regress both critics toward the shared targets in one tape
+        with tf.GradientTape() as tape:
+            critic_values = self.critic([states, actions], training=True)
+            td_errors = y - critic_values
+            # Sum of the per-critic mean losses, same gradients as two separate tapes
+            critic_loss = tf.math.reduce_sum(tf.math.reduce_mean(weights * tf.math.square(td_errors), axis=0))
+        critic_grad = tape.gradient(critic_loss, self.critic.trainable_variables)
+        self.critic.optim.apply_gradients(zip(critic_grad, self.critic.trainable_variables))
+
+        # Delayed actor and target updates
+        active = tf.gather(self.update_schedule, self.train_step % len(self.update_schedule))
+        if active:
+            with tf.GradientTape() as tape:
+                actor_actions = self.actor(states, training=True)
+                # Use critic (1) to optimize policy
+                critic_value = self.critic([states, actor_actions], training=True)[:, :1]
+                actor_loss = -tf.math.reduce_mean(critic_value)
+            actor_grad = tape.gradient(actor_loss, self.actor.trainable_variables)
+            self.actor.optim.apply_gradients(zip(actor_grad, self.actor.trainable_variables))
+            self._blend_targets()
+
+        self.train_step.assign_add(1)
+        return y, td_errors[:, :1]
+
+    def train(self):
+        with profiler.stage('get_batch'):
+            experiences = self.buffer.get_batch()
+        # Target updates run inside the same graph call
+        with profiler.stage('learn'):
+            y, td_errors = self.learn(experiences)
+        with profiler.stage('priorities'):
+            self.buffer.update_priorities(td_errors)
+
+    def _schedule(self, num_batches):
+        # Actor and target schedule live in the graph
+        flags = np.zeros(num_batches, dtype=bool)
+        return flags, flags
+
+class HIRO:
+    # Number of low-level actions between high-level actions
+    period = 20
+    # Problem-specific domain knowledge says pay attention only to x
+    goal_mask = np.array([1,0,1,0,0]).reshape(1,-1)
+
+    def __init__(self, num_states, num_actions, action_bounds, actor_lr=0.001, critic_lr=0.002, gamma=0.99, tau=0.005, num_envs=1, buffer_cls=None,
+                 actor_units=32, critic_units=32):
+        self.pretrain = False
+        # Every environment lane keeps its own goal, trigger and high-level sequence
+        self.num_envs = num_envs
+
+        # Off-policy correction: relabel high-level goals when they are sampled
+        self.off_policy_correction = True
+        self.num_candidates = 10
+        self.candidate_std = 0.5
+        # Relabeling candidates and pre-training goals
+        self.rng = make_rng('hiro')
+
+        # Instantiate hierarchical algorithms, the high level replays whole segments in the matching segment layout
+        buffer_cls = buffer_cls or Buffer
+        segment_cls = segment_buffer_types.get(getattr(buffer_cls, 'func', buffer_cls))
+        if segment_cls is None:
+            raise ValueError('HIRO keeps its high-level segments in memory, {} is not supported'.format(
+                getattr(buffer_cls, 'func', buffer_cls).__name__))
+        units = dict(actor_units=actor_units, critic_units=critic_units)
+        self.lo_algo = DDPG(num_states*2, num_actions, action_bounds, actor_lr=0.001, critic_lr=0.001, gamma=0.99, tau=0.002, buffer_cls=buffer_cls, **units)
+        hi_buffer_cls = partial(segment_cls, num_lo_actions=num_actions, period=self.period, relabel=self.relabel_goals)
+        self.hi_algo = DDPG(num_states, num_states, action_bounds, actor_lr=0.001, critic_lr=0.002, gamma=0.99, tau=0.005, buffer_size=2_000, buffer_cls=hi_buffer_cls, **units)
+
+        # One OU process per lane and action dimension, the high level acts with a full goal (num_states)
+        self.lo_noise = OUActionNoise(mean=np.zeros((num_envs, num_actions)), std_deviation=float(0.1) * np.ones(1), decay=0.98, min_std_dev=0.005)
+        self.hi_noise = OUActionNoise(mean=np.zeros((num_envs, num_states)), std_deviation=float(0.1) * np.ones(1), decay=0.98, min_std_dev=0.01)
+
+        self.hi_triggers = [StepTrigger(every=self.period, num=1) for _ in range(num_envs)]
+        # Segment in progress per lane: states, goals, actions and rewards of up to 'period' steps
+        self.seg_goals = np.zeros((num_envs, self.period, num_states), dtype=np.float32)
+        self.seg_states = np.zeros((num_envs, self.period, num_states), dtype=np.float32)
+        self.seg_actions = np.zeros((num_envs, self.period, num_actions), dtype=np.float32)
+        self.seg_rewards = np.zeros((num_envs, self.period))
+        self.seg_lengths = np.zeros(num_envs, dtype=int)
+        self.lo_rewards = [[] for _ in range(num_envs)]
+
+        self.prev_goal = np.zeros((num_envs, num_states), dtype=np.float32)
+        self.prev_state = np.zeros((num_envs, num_states), dtype=np.float32)
+        self.compile_policy()
+
+    def _goal_transition_func(self, state, goal, next_state):
+        # state + goal = next_state + next_goal
+        state = np.array(state)
+        next_goal = goal + (state - next_state)
+        return np.reshape(next_goal, (-1, np.shape(next_goal)[-1]))
+
+    def _reward(self, state, goal, action, next_state):
+        state = np.array(state)
+        diff = state + goal - next_state
+        # Ignore theta_dot, x_dot, and x_target
+        return -np.linalg.norm(diff * self.goal_mask, axis=-1)
+
+    def relabel_goals(self, states, goals, seq_states, seq_actions, lengths, final_states):
+        """
+            Off-policy correction (Nachum et al. 2018): replace each goal by the candidate under which the
+            current low-level actor most likely produced the stored actions. All candidates of all segments
+            are scored with one actor call over (batch, candidates, period) low-level states.
+        """
+        if not self.off_policy_correction:
+            return goals
+        batch, period = seq_actions.shape[:2]
+
+        # Candidates: original goal, achieved displacement, and noisy displacements around it
+        achieved = final_states - states
+        noise = self.rng.normal(scale=self.candidate_std, size=(batch, self.num_candidates - 2, states.shape[1]))
+        candidates = np.concatenate([goals[:, None], achieved[:, None], achieved[:, None] + noise], 1)
+        candidates = self.hi_algo.action_bound(candidates).astype(np.float32)
+
+        # Goal the low level saw at every step, g_t = g_0 + s_0 - s_t, masked as in policy_batch
+        seq_states = np.broadcast_to(seq_states[:, None], (batch, self.num_candidates) + seq_states.shape[1:])
+        step_goals = (candidates[:, :, None] + (states[:, None, None] - seq_states)) * self.goal_mask
+        lo_states = np.concatenate([seq_states, step_goals.astype(np.float32)], -1)
+        mean_actions = self.lo_algo.actor(lo_states.reshape(-1, lo_states.shape[-1])).numpy()
+        mean_actions = mean_actions.reshape(batch, self.num_candidates, period, -1)
+
+        # Gaussian log-likelihood up to a constant, summed over the valid steps of each segment
+        valid = np.arange(period)[None, None, :] < lengths[:, None, None]
+        log_likelihoods = -0.5 * np.sum(np.square(seq_actions[:, None] - mean_actions), -1)
+        log_likelihoods = np.sum(log_likelihoods * valid, -1)
+        return candidates[np.arange(batch), np.argmax(log_likelihoods, 1)]
+
+    def save(self, path):
+        print('Saving model to', path)
+        self.lo_algo.save_models(f'{path}/lo')
+        self.hi_algo.save_models(f'{path}/hi')
+        return path
+
+    def trackables(self):
+        return {**{'lo_' + key: value for key, value in self.lo_algo.trackables().items()},
+                **{'hi_' + key: value for key, value in self.hi_algo.trackables().items()}}
+
+    def build_optimizers(self):
+        self.lo_algo.build_optimizers()
+        self.hi_algo.build_optimizers()
+
+    def buffers(self):
+        return {'lo': self.lo_algo.buffer, 'hi': self.hi_algo.buffer}
+
+    # Segments, goals and triggers belong to episodes in progress, which are not resumed
+    def get_state(self):
+        return {'lo_noise': self.lo_noise.get_state(), 'hi_noise': self.hi_noise.get_state(), 'pretrain': self.pretrain,
+                'rng': self.rng.bit_generator.state}
+
+    def set_state(self, state):
+        self.lo_noise.set_state(state['lo_noise'])
+        self.hi_noise.set_state(state['hi_noise'])
+        self.pretrain = state['pretrain']
+        self.rng.bit_generator.state = state['rng']
+
+    def pretrain(self, env, noise):
+        # Pre-train lower level network for 2M steps
+        random_goal = lambda : self.rng.normal(size=len(prev_state), scale=0.0)
+        length = 100_000
+        prev_state = env.reset()
+        prev_goal = random_goal()
+        reward_list = []
+        try:
+            for i in range(length):
+                if i % 1000 == 0: print('Pretrain step', i, '/', length, np.mean(reward_list[-1000:]))
+                lo_state = np.concatenate((prev_state, prev_goal))
+                action = self.lo_algo.policy(lo_state, noise)
+
+                # Interact with environment and record experience
+                state, __reward, done, __info = env.step(action)
+                reward = self._reward(prev_state, prev_goal, action, state)
+                goal = self._goal_transition_func(prev_state, prev_goal, state)
+                self.lo_algo.record(lo_state, action, reward, np.concatenate((state, goal)), 0.0 if done else 1.0)
+                prev_state = state
+                prev_goal = goal
+
+                reward_list.append(reward)
+
+                # Offline Experience Replay
+                self.lo_algo.train()
+
+                if done:
+                    prev_state = env.reset()
+                    prev_goal = random_goal()
+        except KeyboardInterrupt:
+            pass
+        with open('output', 'w') as f:
+            print(reward_list, sep='\n', file=f)
+
+    def policy(self, state, noise, pretrain=False):
+        action = self.policy_batch(np.reshape(state, (1,-1)), noise, pretrain)
+        return [np.squeeze(action[0])]
+
+    def compile_policy(self, jit_compile=False):
+        self.hi_algo.compile_policy(jit_compile)
+        spec = tf.TensorSpec((None, self.prev_goal.shape[1]), tf.float32)
+        self._act_lo_fn = tf.function(self._act_lo, jit_compile=jit_compile, input_signature=[spec] * 3)
+        self._obs = np.zeros_like(self.prev_state)
+
+    def _act_lo(self, states, prev_state, prev_goal):
+        # Transition goal to keep target (state + goal) fixed, then mask it, as _goal_transition_func does
+        goal = (prev_goal + prev_state - states) * tf.constant(self.goal_mask, tf.float32)
+        return self.lo_algo.actor(tf.concat([states, goal], 1), training=False)
+
+    def policy_batch(self, states, noise, pretrain=False):
+        np.copyto(self._obs, states)
+        # Create new goals from hi-network for the lanes whose period is up
+        active = np.array([trigger.active() for trigger in self.hi_triggers])
+        if active.any():
+            if pretrain:
+                goals = self.rng.normal(size=self._obs.shape, scale=0.2)
+            else:
+                with profiler.stage('hi.policy'):
+                    goals = self.hi_algo.policy_batch(self._obs, self.hi_noise)
+            self.prev_goal[active] = goals[active]
+            self.prev_state[active] = self._obs[active]
+            self.pretrain = pretrain
+            # print('New Goal: ', self.prev_goal.flatten())
+        # Prompt lo-network for atomic actions (on Env), one graph call for all lanes
+        actions = self._act_lo_fn(self._obs, self.prev_state, self.prev_goal).numpy()
+        actions += self.lo_noise()
+        return self.lo_algo.action_bound(actions, out=actions)
+
+    def record(self, prev_state, action, reward, state, done):
+        self.record_batch(np.reshape(prev_state, (1,-1)), np.reshape(action, (1,-1)),
+                          np.reshape(reward, (1,)), np.reshape(state, (1,-1)), np.reshape(done, (1,)))
+
+    def record_batch(self, prev_states, actions, rewards, states, dones):
+        for trigger in self.hi_triggers:
+            trigger.step()
+
+        prev_states = np.asarray(prev_states)
+        states = np.asarray(states)
+
+        prev_goal = self.prev_goal
+        lo_rewards = np.where(dones, rewards, self._reward(prev_states, prev_goal, actions, states))
+        next_goal = self._goal_transition_func(prev_states, prev_goal, states)
+
+        lo_prev_states = np.concatenate([prev_states, prev_goal], 1)
+        lo_states = np.concatenate([states, next_goal], 1)
+        self.lo_algo.record_batch(lo_prev_states, actions, lo_rewards, lo_states, dones)
+
+        # Don't collect experiences while low-level controller is figuring things out
+        if not self.pretrain:
+            lanes = np.arange(self.num_envs)
+            steps = self.seg_lengths
+            self.seg_goals[lanes, steps] = prev_goal
+            self.seg_states[lanes, steps] = prev_states
+            self.seg_actions[lanes, steps] = np.reshape(actions, (self.num_envs, -1))
+            self.seg_rewards[lanes, steps] = rewards
+            self.seg_lengths += 1
+
+        for i in range(self.num_envs):
+            self.lo_rewards[i].append(np.round(lo_rewards[i], 2))
+
+            # If done_val indicates that the trial has terminated
+            if dones[i]:
+                logger.info('    Lo_Reward: %s', np.round(np.mean(self.lo_rewards[i]),2))
+                self.lo_rewards[i] = []
+                self.hi_triggers[i].reset()
+                self.lo_noise.end_episodes([i])
+
+                # Not using higher network, leave noise alone
+                if not self.pretrain:
+                    self.hi_noise.end_episodes([i])
+
+            # Time to update hi_algo, goals are corrected when the segment is sampled
+            length = self.seg_lengths[i]
+            if (self.hi_triggers[i].active() or length == self.period) and length > 0 and not self.pretrain:
+                with profiler.stage('buffer.segment'):
+                    self.hi_algo.buffer.record_segment(self.seg_states[i], self.seg_goals[i], self.seg_actions[i], self.seg_rewards[i],
+                                                       length, states[i], 0.0 if dones[i] else 1.0)
+                self.seg_lengths[i] = 0
+
+        np.copyto(self.prev_goal, next_goal)
+        np.copyto(self.prev_state, states)
+
+    def compile_learner(self, jit_compile=False):
+        self.lo_algo.compile_learner(jit_compile)
+        self.hi_algo.compile_learner(jit_compile)
+
+    @property
+    def trace_count(self):
+        return self.lo_algo.trace_count + self.hi_algo.trace_count
+
+    # The get_batch, learn and update_targets stages count both levels, hi.train and lo.train split them
+    def train(self):
+        if self.hi_algo.buffer.buffer_counter > 0:
+            with profiler.stage('hi.train'):
+                self.hi_algo.train()
+        with profiler.stage('lo.train'):
+            self.lo_algo.train()
+
+    def train_many(self, num_batches):
+        if self.hi_algo.buffer.buffer_counter > 0:
+            with profiler.stage('hi.train'):
+                self.hi_algo.train_many(num_batches)
+        with profiler.stage('lo.train'):
+            self.lo_algo.train_many(num_batches)
+
+# Algorithms selectable on the command line (TrainConfig.algo)
+algorithm_types = {'DDPG': DDPG, 'TD3': TD3, 'FusedTD3': FusedTD3, 'HIRO': HIRO}
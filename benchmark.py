@@ -0,0 +1,628 @@
+"""
+    Benchmarks for basicgym components, headless and CPU only.
+        python benchmark.py buffer
+        python benchmark.py buffer learn targets hiro_step env train [--Save] [--Threshold=0.25] [--Baselines=<file>]
+    Rates the benchmarks report (rows/s, updates/s, steps/s) are compared with the baselines stored in
+    benchmark-baselines.json, the run exits with status 1 if the geometric mean of a benchmark's rates relative to
+    their baselines drops by more than Threshold. --Save stores this run's rates as the new baselines instead.
+    Baselines depend on the machine, save them on the one that compares against them.
+    'noise', 'retrace', 'wobble', 'checkpoint', 'export' and 'seed' are checks as well as benchmarks, they exit with
+    status 1 if restored OU noise does not continue the saved one, if training retraces after warm-up, if the NumPy
+    cart-pole leaves the Bullet trajectory, if a checkpoint does not restore exactly, if an exported NumPy actor does
+    not match Keras or if a seeded run cannot be repeated bit for bit.
+"""
+
+import os
+# Benchmarks always measure the CPU path
+os.environ.setdefault('CUDA_VISIBLE_DEVICES', '')
+
+import time
+import shutil
+import tempfile
+import json
+import subprocess
+import tracemalloc
+from contextlib import redirect_stdout
+from functools import partial
+import sys
+from sys import argv
+from getopt import gnu_getopt
+
+import numpy as np
+import tensorflow as tf
+
+import gym
+from pybullet_envs.bullet import CartPoleContinuousBulletEnv
+
+from ECE239AS_Envs import CartPoleWobbleVecEnv, DummyVecEnv, make_vec_env
+from algorithms import Bounds, OUActionNoise, DDPG, TD3, FusedTD3, HIRO, get_actor
+from buffers import Buffer, PackedBuffer, PrioritizedBuffer
+from config import TrainConfig
+from training import train
+from checkpoint import Checkpointer
+from metrics import read_metrics
+import numpy_policy
+from profiling import profiler
+from seeding import set_run_seed
+
+baselines_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark-baselines.json')
+# Rates measured by this run, by key: (value, unit). Higher is better for every one of them
+results = {}
+
+def result(key, value, unit):
+    results[key] = (float(value), unit)
+
+def compare(baselines, threshold):
+    """
+        Every measured rate next to its baseline, then the geometric mean of the ratios of each benchmark (the first
+        word of its keys). Single rates move by 20-40% between runs on a busy machine, the means of a benchmark much
+        less, so only those are held to 'threshold'. Returns the benchmarks whose mean fell more than that.
+    """
+    ratios = {}
+    print('{:60} {:>14} {:>14} {:>8}'.format('vs. baseline', 'baseline', 'now', 'change'))
+    for key, (value, unit) in results.items():
+        if key not in baselines:
+            print('{:60} {:>14} {:14.1f} {:>8}  {}'.format(key, '-', value, '', unit))
+            continue
+        baseline = baselines[key][0]
+        ratios.setdefault(key.split()[0], []).append(value / baseline)
+        print('{:60} {:14.1f} {:14.1f} {:+7.1f}%  {}'.format(key, baseline, value, (value / baseline - 1) * 100, unit))
+
+    regressions = []
+    for name, values in ratios.items():
+        change = np.exp(np.mean(np.log(values))) - 1
+        regressed = change < -threshold
+        if regressed:
+            regressions.append(name)
+        print('{:>12} {:+7.1f}% geometric mean over {} rates{}'.format(name, change * 100, len(values),
+                                                                     '  REGRESSION' if regressed else ''))
+    return regressions
+
+def timeit(func, iters, repeats=1):
+    # Warm up once so one-time costs (tracing, first allocation) are not measured.
+    # With repeats, the best of that many rounds of iters // repeats calls: other load on the machine only slows a round down
+    func()
+    rounds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(iters // repeats):
+            func()
+        rounds.append((time.perf_counter() - start) / (iters // repeats))
+    return min(rounds)
+
+def allocated_per_call(func, iters=20):
+    # Peak memory requested during one call, includes the host copy TensorFlow makes when converting
+    func()
+    tracemalloc.start()
+    peaks = []
+    for _ in range(iters):
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        func()
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+    return np.median(peaks)
+
+def fill(buffer, num_states, num_actions, rows, chunk=10_000):
+    for start in range(0, rows, chunk):
+        num = min(chunk, rows - start)
+        buffer.record_batch((np.random.normal(size=(num, num_states)), np.random.uniform(-1, 1, (num, num_actions)),
+                             np.random.normal(size=(num, 1)), np.random.normal(size=(num, num_states)), np.ones((num, 1))))
+
+def fill_segments(algo, rows):
+    # High-level HIRO segments of random length
+    period, num_states, num_actions = algo.period, algo.lo_algo.num_states // 2, algo.lo_algo.num_actions
+    for _ in range(rows):
+        algo.hi_algo.buffer.record_segment(np.random.normal(size=(period, num_states)), np.random.normal(size=(period, num_states)),
+                                           np.random.uniform(-1, 1, (period, num_actions)), np.random.normal(size=period),
+                                           np.random.randint(1, period + 1), np.random.normal(size=num_states), 1.0)
+
+def bench_buffer(capacities=(10_000, 100_000, 500_000), batch_sizes=(64, 256, 1024), lanes=(1, 16), iters=2_000,
+                 num_states=5, num_actions=1):
+    print('Buffer.record_batch of one row per lane and get_batch, in full buffers')
+    print('{:>18} {:>8} {:>10} {:>12} {:>14} {:>14}'.format('buffer', 'capacity', 'call', 'us/call', 'rows/s', 'bytes/call'))
+    for capacity in capacities:
+        for cls in Buffer, PackedBuffer, PrioritizedBuffer:
+            for batch_size in batch_sizes:
+                buffer = cls(num_states, num_actions, capacity, batch_size)
+                fill(buffer, num_states, num_actions, capacity)
+                calls = [('batch={}'.format(batch_size), buffer.get_batch, batch_size)]
+                # Recording does not depend on the batch size
+                if batch_size == batch_sizes[0]:
+                    for num in lanes:
+                        rows = (np.random.normal(size=(num, num_states)), np.random.uniform(-1, 1, (num, num_actions)),
+                                np.random.normal(size=(num, 1)), np.random.normal(size=(num, num_states)), np.ones((num, 1)))
+                        calls.insert(0, ('record={}'.format(num), partial(buffer.record_batch, rows), num))
+                for name, func, rows in calls:
+                    seconds = timeit(func, iters, repeats=5)
+                    allocated = allocated_per_call(func)
+                    print('{:>18} {:>8} {:>10} {:12.1f} {:14.0f} {:14.0f}'.format(
+                        cls.__name__, capacity, name, seconds * 1e6, rows / seconds, allocated))
+                    result('buffer {} {} {}'.format(cls.__name__, capacity, name), rows / seconds, 'rows/s')
+
+def bench_td3(iters=2_000, num_states=5, num_actions=1):
+    print('Training updates/s (train() = get_batch + learn + update_targets)')
+    for cls in DDPG, TD3, FusedTD3:
+        algo = cls(num_states, num_actions, Bounds(-1, 1))
+        fill(algo.buffer, num_states, num_actions, 10_000)
+        # Run a full actor schedule cycle so every traced branch exists before timing
+        for _ in range(8):
+            algo.train()
+        seconds = timeit(algo.train, iters)
+        print('{:>10} {:10.1f} updates/s {:8.1f} us/update'.format(cls.__name__, 1 / seconds, seconds * 1e6))
+
+def bench_learn(iters=500, units=(32, 64, 128), num_states=5, num_actions=1):
+    print('learn() updates/s on one fixed batch, ActorNN x CriticNN grid of scan.ps1')
+    for cls in DDPG, TD3:
+        for actor_units in units:
+            for critic_units in units:
+                algo = cls(num_states, num_actions, Bounds(-1, 1), actor_units=actor_units, critic_units=critic_units)
+                fill(algo.buffer, num_states, num_actions, 10_000)
+                batch = algo.buffer.get_batch()
+                seconds = timeit(partial(algo.learn, batch), iters, repeats=5)
+                key = '{} A{} C{}'.format(cls.__name__, actor_units, critic_units)
+                print('{:>16} {:10.1f} updates/s {:8.1f} us/update'.format(key, 1 / seconds, seconds * 1e6))
+                result('learn ' + key, 1 / seconds, 'updates/s')
+
+def bench_targets(iters=1_000, units=(32, 64, 128), num_states=5, num_actions=1):
+    print('Target network blend (tau) of every target network, ActorNN = CriticNN')
+    for cls in DDPG, TD3, FusedTD3:
+        for size in units:
+            algo = cls(num_states, num_actions, Bounds(-1, 1), actor_units=size, critic_units=size)
+            # TD3.update_targets skips most steps, time the blend itself
+            blend = algo.update_targets if cls is not TD3 else algo._blend_targets
+            seconds = timeit(blend, iters, repeats=5)
+            key = '{} units={}'.format(cls.__name__, size)
+            print('{:>18} {:10.1f} blends/s {:8.1f} us/blend'.format(key, 1 / seconds, seconds * 1e6))
+            result('targets ' + key, 1 / seconds, 'blends/s')
+
+def bench_superbatch(updates=4_096, super_batches=(1, 4, 16, 64), num_states=5, num_actions=1):
+    print('Training updates/s with K updates per sampled super-batch (K=1 is train())')
+    for cls in DDPG, TD3, FusedTD3:
+        algo = cls(num_states, num_actions, Bounds(-1, 1), buffer_cls=PackedBuffer)
+        fill(algo.buffer, num_states, num_actions, 10_000)
+        for _ in range(8):
+            algo.train()
+        for k in super_batches:
+            step = algo.train if k == 1 else partial(algo.train_many, k)
+            seconds = timeit(step, updates // k) / k
+            print('{:>10} K={:<3} {:10.1f} updates/s {:8.1f} us/update'.format(cls.__name__, k, 1 / seconds, seconds * 1e6))
+
+def bench_relabel(iters=200, num_states=5, num_actions=1):
+    print('HIRO high-level get_batch, 64 segments x 10 candidates x 20 steps')
+    algo = HIRO(num_states, num_actions, Bounds(-1, 1))
+    fill_segments(algo, 2_000)
+    for correction in False, True:
+        algo.off_policy_correction = correction
+        seconds = timeit(algo.hi_algo.buffer.get_batch, iters)
+        print('{:>22} {:10.1f} us/batch'.format('relabeled' if correction else 'stored goals', seconds * 1e6))
+
+def bench_segments(segments=200_000, report_every=50_000, num_states=5, num_actions=1):
+    print('HIRO high-level segment store, memory while recording {} segments'.format(segments))
+    algo = HIRO(num_states, num_actions, Bounds(-1, 1))
+    buffer = algo.hi_algo.buffer
+    period = algo.period
+    seq = np.random.normal(size=(period, num_states)), np.random.normal(size=(period, num_states)), \
+          np.random.uniform(-1, 1, (period, num_actions)), np.random.normal(size=period)
+    final_state = np.random.normal(size=num_states)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    for i in range(1, segments + 1):
+        buffer.record_segment(*seq, period, final_state, 1.0)
+        if i % report_every == 0:
+            current, peak = tracemalloc.get_traced_memory()
+            print('{:>10} segments {:10.1f} us/segment {:12} bytes traced'.format(
+                i, (time.perf_counter() - start) / i * 1e6, current))
+    tracemalloc.stop()
+
+def bench_act(iters=2_000, lanes=(1, 8), num_states=5, num_actions=1):
+    print('Acting: policy_batch actions/s (all lanes per call)')
+    for num_envs in lanes:
+        for cls in DDPG, TD3, HIRO:
+            kwargs = dict(num_envs=num_envs) if cls is HIRO else {}
+            algo = cls(num_states, num_actions, Bounds(-1, 1), **kwargs)
+            noise = OUActionNoise(mean=np.zeros((num_envs, num_actions)), std_deviation=0.2 * np.ones(1))
+            states = np.random.normal(size=(num_envs, num_states))
+            def act():
+                algo.policy_batch(states, noise)
+                # HIRO picks a new goal every 'period' calls, as in training
+                for trigger in getattr(algo, 'hi_triggers', []):
+                    trigger.step()
+            seconds = timeit(act, iters)
+            print('{:>6} lanes={:<3} {:10.0f} actions/s {:8.1f} us/call'.format(cls.__name__, num_envs, num_envs / seconds, seconds * 1e6))
+
+def bench_hiro_step(iters=2_000, lanes=(1, 8), num_states=5, num_actions=1):
+    print('HIRO acting and recording: policy_batch + record_batch per environment step, hi-level goals on')
+    for num_envs in lanes:
+        algo = HIRO(num_states, num_actions, Bounds(-1, 1), num_envs=num_envs)
+        states = np.random.normal(size=(num_envs, num_states))
+        rewards = np.random.normal(size=num_envs)
+        # An episode ends in some lane every 50 steps
+        dones = [np.arange(num_envs) == (step // 50) % num_envs if step % 50 == 49 else np.zeros(num_envs, dtype=bool)
+                 for step in range(200)]
+        step = 0
+        def act_record():
+            nonlocal step
+            actions = algo.policy_batch(states, None)
+            algo.record_batch(states, actions, rewards, states, dones[step % len(dones)])
+            step += 1
+        seconds = timeit(act_record, iters, repeats=5)
+        print('{:>6} lanes={:<3} {:10.0f} steps/s {:8.1f} us/call'.format('HIRO', num_envs, num_envs / seconds, seconds * 1e6))
+        result('hiro step lanes={}'.format(num_envs), num_envs / seconds, 'steps/s')
+
+def bench_env(iters=2_000, lanes=(1, 8), numpy_lanes=(1, 1024)):
+    print('CartPoleWobble step throughput: Bullet environment, in-process vector environment, NumPy lanes')
+    actions = np.random.uniform(-1, 1, (max(lanes + numpy_lanes), 1)).astype(np.float32)
+    env = gym.make('CartPoleWobbleContinuousEnv-v0')
+    env.seed(0)
+    env.reset()
+    def step():
+        if env.step(actions[0])[2]:
+            env.reset()
+    envs = [('Bullet', 1, step, env)]
+    for num_envs in lanes:
+        vec_env = DummyVecEnv('CartPoleWobbleContinuousEnv-v0', num_envs)
+        vec_env.seed(0)
+        vec_env.reset()
+        envs.append(('DummyVecEnv', num_envs, partial(vec_env.step, actions[:num_envs]), vec_env))
+    for num_envs in numpy_lanes:
+        vec_env = CartPoleWobbleVecEnv(num_envs)
+        vec_env.reset()
+        envs.append(('NumPy', num_envs, partial(vec_env.step, actions[:num_envs]), vec_env))
+    for name, num_envs, func, env in envs:
+        seconds = timeit(func, iters, repeats=5)
+        print('{:>12} lanes={:<5} {:12.0f} steps/s {:8.1f} us/call'.format(name, num_envs, num_envs / seconds, seconds * 1e6))
+        result('env {} lanes={}'.format(name, num_envs), num_envs / seconds, 'steps/s')
+        env.close()
+
+def bench_train(steps=1_500, warmup=200, repeats=3, seed=0):
+    print('End to end: {} training steps (act, step, record, one update) after {} warm-up steps, seeded, best of {} rounds'.format(
+        steps, warmup, repeats))
+    runs = [('DDPG', 'CartPoleWobbleContinuousEnv-v0', 1), ('TD3', 'CartPoleWobbleContinuousEnv-v0', 1),
+            ('HIRO', 'CartPoleWobbleContinuousEnv-v0', 1), ('TD3', 'CartPoleWobbleNumpy-v0', 16)]
+    for name, problem, num_envs in runs:
+        set_run_seed(seed)
+        tf.keras.utils.set_random_seed(seed)
+        env = make_vec_env(problem, num_envs)
+        env.seed(seed)
+        num_states, num_actions = env.observation_space.shape[0], env.action_space.shape[0]
+        kwargs = dict(num_envs=num_envs) if name == 'HIRO' else {}
+        algo = {'DDPG': DDPG, 'TD3': TD3, 'HIRO': HIRO}[name](num_states, num_actions, Bounds(-1, 1), **kwargs)
+        noise = OUActionNoise(mean=np.zeros((num_envs, num_actions)), std_deviation=0.5 * np.ones(1), decay=0.98, min_std_dev=0.01)
+        states = env.reset()
+
+        # The synchronous loop of training.train without the logging
+        def run(num_steps):
+            nonlocal states
+            for _ in range(num_steps):
+                actions = algo.policy_batch(states, noise)
+                next_states, rewards, dones, infos = env.step(actions)
+                final_states = np.array(next_states)
+                for i in np.flatnonzero(dones):
+                    final_states[i] = infos[i]['terminal_observation']
+                    noise.end_episodes([i])
+                algo.record_batch(states, actions, rewards, final_states, dones)
+                algo.train()
+                states = next_states
+        run(warmup)
+        rounds = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            run(steps // repeats)
+            rounds.append((time.perf_counter() - start) / (steps // repeats))
+        seconds = min(rounds) * steps
+        env.close()
+        key = '{} {} lanes={}'.format(name, problem, num_envs)
+        print('{:>44} {:8.1f} steps/s {:10.0f} transitions/s'.format(key, steps / seconds, steps * num_envs / seconds))
+        result('train ' + key, steps / seconds, 'steps/s')
+
+def bench_noise(iters=5_000, lanes=(1, 64, 1024), dims=(1, 5)):
+    print('OU noise: one call for all lanes, samples drawn every step (block=1) or pre-generated 256 steps at a time')
+    for num_envs in lanes:
+        for num_actions in dims:
+            line = 'lanes={:<5} dims={}'.format(num_envs, num_actions)
+            for block in 1, 256:
+                noise = OUActionNoise(mean=np.zeros((num_envs, num_actions)), std_deviation=0.2 * np.ones(1), block=block)
+                seconds = timeit(noise, iters)
+                line += '   block={:<4} {:8.2f} us/call {:12.0f} samples/s'.format(block, seconds * 1e6, num_envs * num_actions / seconds)
+            print(line)
+
+    # Saved mid-block, at a block boundary and before the first block, restored into a fresh bank: the restored
+    # noise must continue exactly where the original one goes on
+    failed = []
+    block = 4
+    for steps in 0, 3, 4, 8, 9:
+        make = lambda: OUActionNoise(mean=np.zeros((2, 3)), std_deviation=0.2 * np.ones(1), block=block)
+        noise = make()
+        for _ in range(steps):
+            noise()
+        restored = make()
+        restored.set_state(noise.get_state())
+        same = all(np.array_equal(noise(), restored()) for _ in range(3 * block))
+        print('resumed after {} steps (block={}) {}'.format(steps, block, 'identical' if same else 'DIFFERENT'))
+        if not same:
+            failed.append(steps)
+    if failed:
+        raise SystemExit('restored noise does not continue the saved one after steps {}'.format(failed))
+
+def bench_profile(iters=100_000, updates=2_000, num_states=5, num_actions=1):
+    print('Profiler cost per timed stage and per TD3 train() (four stages) with it disabled and enabled')
+    def timed():
+        with profiler.stage('bench'):
+            pass
+    algo = TD3(num_states, num_actions, Bounds(-1.0, 1.0), buffer_cls=PackedBuffer)
+    fill(algo.buffer, num_states, num_actions, 100_000)
+    baseline = timeit(lambda: None, iters)
+    for enabled in (False, True):
+        profiler.enable() if enabled else profiler.disable()
+        stage = timeit(timed, iters) - baseline
+        count = timeit(partial(profiler.count, 'bench', 1), iters) - baseline
+        train = timeit(algo.train, updates)
+        profiler.reset()
+        print('{:>10} {:8.3f} us/stage {:8.3f} us/count {:10.1f} us/train'.format(
+            'enabled' if enabled else 'disabled', stage * 1e6, count * 1e6, train * 1e6))
+    profiler.disable()
+
+def check_retrace(warmup=8, steps=200, num_states=5, num_actions=1):
+    failed = []
+    for cls in DDPG, TD3, FusedTD3, HIRO:
+        for buffer_cls in Buffer, PackedBuffer, PrioritizedBuffer:
+            algo = cls(num_states, num_actions, Bounds(-1, 1), buffer_cls=buffer_cls)
+            fill(algo.lo_algo.buffer if cls is HIRO else algo.buffer, num_states * (2 if cls is HIRO else 1), num_actions, 1_000)
+            if cls is HIRO:
+                fill_segments(algo, 200)
+            for _ in range(warmup):
+                algo.train()
+                algo.train_many(4)
+            warm = algo.trace_count
+            for step in range(steps):
+                algo.train()
+                # Super-batches of any size share one trace
+                algo.train_many(1 + step % 8)
+            status = 'ok' if algo.trace_count == warm else 'RETRACED'
+            print('{:>10} {:>18} traces after warm-up {:3}, after {} more steps {:3}  {}'.format(
+                cls.__name__, buffer_cls.__name__, warm, steps, algo.trace_count, status))
+            if algo.trace_count != warm:
+                failed.append((cls.__name__, buffer_cls.__name__))
+    if failed:
+        raise SystemExit('learn retraced after warm-up: {}'.format(failed))
+
+def check_wobble(steps=3_000, lanes=(1, 64, 1024), iters=200, tolerance=1e-6):
+    # Matched trajectories: same seeds and actions for the Bullet and NumPy versions, lane by lane
+    num_envs = 4
+    bullet, numpy_env = DummyVecEnv('CartPoleWobbleContinuousEnv-v0', num_envs), CartPoleWobbleVecEnv(num_envs)
+    bullet.seed(0)
+    numpy_env.seed(0)
+    expected, states = bullet.reset(), numpy_env.reset()
+    rng = np.random.default_rng(0)
+    error, episodes = np.abs(expected - states).max(), 0
+    for _ in range(steps):
+        actions = rng.uniform(-1, 1, (num_envs, 1))
+        expected, expected_rewards, expected_dones, expected_infos = bullet.step(actions)
+        states, rewards, dones, infos = numpy_env.step(actions)
+        if (dones != expected_dones).any() or (rewards != expected_rewards).any():
+            raise SystemExit('NumPy cart-pole diverged from Bullet in rewards or dones')
+        for i in np.flatnonzero(dones):
+            error = max(error, np.abs(np.array(infos[i]['terminal_observation']) - expected_infos[i]['terminal_observation']).max())
+        error = max(error, np.abs(expected - states).max())
+        episodes += dones.sum()
+    bullet.close()
+    print('NumPy vs Bullet cart-pole: {} steps x {} lanes, {} episodes, max state error {:.2e}'.format(steps, num_envs, episodes, error))
+    if error > tolerance:
+        raise SystemExit('NumPy cart-pole state error {:.2e} above {:.0e}'.format(error, tolerance))
+
+    for num_envs in lanes:
+        env = CartPoleWobbleVecEnv(num_envs)
+        env.reset()
+        actions = np.random.uniform(-1, 1, (num_envs, 1))
+        seconds = timeit(partial(env.step, actions), iters)
+        print('{:>10} lanes={:<5} {:12.0f} steps/s {:8.1f} us/call'.format('NumPy', num_envs, num_envs / seconds, seconds * 1e6))
+
+def bench_obs(iters=5_000, sequence=20):
+    print('CartPoleWobbleContinuousEnv observations: step time, Python memory requested per call and conversion to a float32 actor input row')
+    env = gym.make('CartPoleWobbleContinuousEnv-v0').unwrapped
+    env.seed(0)
+    env.reset()
+    actions = np.random.uniform(-1, 1, (sequence, 1)).astype(np.float32)
+    obs = np.empty((1, 5), dtype=np.float32)
+    row = obs[0]
+    buffer = np.empty((sequence, 5), dtype=np.float32)
+
+    def list_step(action):
+        # The former observation path: the parent's float64 copy, repacked into a list with the target
+        raw_state, reward, done, info = CartPoleContinuousBulletEnv.step(env, action)
+        return [*raw_state, env.target_pos], reward, done, info
+
+    def run(step):
+        state, reward, done, info = step(actions[0])
+        obs[0] = state
+        if done: env.reset(out=row)
+
+    def step_out(action):
+        return env.step(action, out=row)
+
+    def run_many():
+        # One call per 'sequence' steps, reported per step below
+        states, rewards, dones, info = env.step_many(actions, out=buffer)
+        if dones[-1]: env.reset(out=row)
+
+    for name, func, steps in (('list (before)', partial(run, list_step), 1), ('step()', partial(run, env.step), 1),
+                              ('step(out=)', partial(run, step_out), 1), ('step_many(out=)', run_many, sequence)):
+        seconds = timeit(func, iters // steps) / steps
+        allocated = allocated_per_call(func)
+        print('{:>18} {:10.1f} us/step {:10.0f} bytes/call ({} steps)'.format(name, seconds * 1e6, allocated, steps))
+
+    state = list_step(actions[0])[0]
+    seconds = timeit(partial(obs.__setitem__, 0, state), iters)
+    print('{:>18} {:10.2f} us/conversion'.format('list -> float32', seconds * 1e6))
+    state = env.step(actions[0])[0]
+    seconds = timeit(partial(obs.__setitem__, 0, state), iters)
+    print('{:>18} {:10.2f} us/conversion'.format('float32 -> float32', seconds * 1e6))
+    env.close()
+
+def variables_of(trackable):
+    # Models have a variables property, optimizers a method, the step counter is a variable itself and
+    # a random generator keeps its counter in a state variable
+    if isinstance(trackable, tf.Variable):
+        return [trackable]
+    if isinstance(trackable, tf.random.Generator):
+        return [trackable.state]
+    variables = trackable.variables
+    return variables() if callable(variables) else variables
+
+def check_checkpoint(rows=100_000, num_states=5, num_actions=1):
+    print('Checkpoint: time on the training thread, background write time, and exact restore into a fresh algorithm')
+    failed = []
+    for cls in DDPG, TD3, FusedTD3, HIRO:
+        for buffer_cls in Buffer, PackedBuffer, PrioritizedBuffer:
+            make = lambda: cls(num_states, num_actions, Bounds(-1, 1), buffer_cls=buffer_cls)
+            algo = make()
+            lo = algo.lo_algo if cls is HIRO else algo
+            fill(lo.buffer, lo.num_states, num_actions, rows)
+            if cls is HIRO:
+                fill_segments(algo, 200)
+            for _ in range(5):
+                algo.train()
+
+            directory = tempfile.mkdtemp()
+            try:
+                checkpointer = Checkpointer(directory, algo)
+                # First save writes every row, later ones only the rows recorded in between.
+                # TensorFlow traces its variable copy on the first saves, the last one is timed
+                for episode in range(3):
+                    fill(lo.buffer, lo.num_states, num_actions, 1_000)
+                    algo.train()
+                    start = time.perf_counter()
+                    checkpointer.save({'episode': episode})
+                    saved = time.perf_counter() - start
+                    checkpointer.wait()
+                    written = time.perf_counter() - start
+                expected = {key: [v.numpy() for v in variables_of(value)] for key, value in algo.trackables().items()}
+                expected_state = {name: buffer.get_state()['counter'] for name, buffer in algo.buffers().items()}
+                expected_rows = {name: {key: array.copy() for key, array in buffer.ring_arrays().items()} for name, buffer in algo.buffers().items()}
+
+                restored = make()
+                progress = Checkpointer(directory, restored).restore()
+                same = progress['episode'] == 2
+                for key, value in restored.trackables().items():
+                    same &= all(np.array_equal(a, b.numpy()) for a, b in zip(expected[key], variables_of(value)))
+                for name, buffer in restored.buffers().items():
+                    same &= buffer.buffer_counter == expected_state[name]
+                    same &= all(np.array_equal(expected_rows[name][key], array) for key, array in buffer.ring_arrays().items())
+            finally:
+                shutil.rmtree(directory)
+            print('{:>10} {:>18} {:8.1f} ms on the training thread {:8.1f} ms until written  {}'.format(
+                cls.__name__, buffer_cls.__name__, saved * 1e3, written * 1e3, 'ok' if same else 'MISMATCH'))
+            if not same:
+                failed.append((cls.__name__, buffer_cls.__name__))
+    if failed:
+        raise SystemExit('checkpoint did not restore exactly: {}'.format(failed))
+
+def startup(code):
+    # Seconds for a fresh interpreter to run 'code', imports included
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', code], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+def check_export(units=(32, 64, 128), batches=(1, 1024), iters=2_000, num_states=10, num_actions=1):
+    # num_states=10 is HIRO's low-level actor input (state and goal)
+    directory = tempfile.mkdtemp()
+    failed = []
+    try:
+        for unit in units:
+            actor = get_actor(num_states, num_actions, unit)
+            # Trained-looking output layer, the initial one is near zero everywhere
+            kernel, bias = actor.layers[-2].get_weights()
+            actor.layers[-2].set_weights([np.random.normal(scale=0.5, size=kernel.shape), bias])
+            path = os.path.join(directory, f'actor{unit}')
+            actor.save(path)
+            act = tf.function(lambda states: actor(states, training=False))
+            for dtype in numpy_policy.tolerances:
+                try:
+                    out, error = numpy_policy.export(path, dtype=dtype)
+                except ValueError as e:
+                    print(e)
+                    failed.append((unit, dtype))
+                    continue
+                policy = numpy_policy.NumpyActor(out)
+                line = '{:>4} units {:>8} {:6} bytes max difference {:.1e}'.format(unit, dtype, os.path.getsize(out), error)
+                for batch in batches:
+                    states = np.random.normal(size=(batch, num_states)).astype(np.float32)
+                    seconds = timeit(partial(policy, states), iters)
+                    keras_seconds = timeit(partial(act, states), iters)
+                    line += '   batch {:<5} NumPy {:8.1f} us Keras {:8.1f} us'.format(batch, seconds * 1e6, keras_seconds * 1e6)
+                print(line)
+
+        # Controller start: fresh process, imports and loading the actor
+        path = os.path.join(directory, f'actor{units[0]}')
+        numpy_seconds = startup(f"from numpy_policy import NumpyActor; NumpyActor({path + '-float32.npz'!r})([0.0] * {num_states})")
+        keras_seconds = startup(f"import tensorflow as tf; tf.keras.models.load_model({path!r}, compile=False)(tf.zeros((1, {num_states})))")
+        print('Startup to first action: NumPy {:.0f} ms, Keras {:.0f} ms, interpreter alone {:.0f} ms'.format(
+            numpy_seconds * 1e3, keras_seconds * 1e3, startup('pass') * 1e3))
+    finally:
+        shutil.rmtree(directory)
+    if failed:
+        raise SystemExit('exported actors differ from Keras: {}'.format(failed))
+
+def check_seed(episodes=12, checkpoint_every=4, seed=7):
+    # Same seed twice, and the same run stopped at a checkpoint and resumed: metrics and final actors must be identical
+    failed = []
+    # Training logs go here, the log handler of the last run keeps writing to it
+    devnull = open(os.devnull, 'w')
+    for algo in 'DDPG', 'TD3', 'FusedTD3', 'HIRO':
+        directory = tempfile.mkdtemp()
+        try:
+            def run(total_episodes, resume=None):
+                kwargs = dict(algo=algo, seed=seed, render=0, model_dir=directory, total_episodes=total_episodes, checkpoint_every=checkpoint_every)
+                if resume:
+                    with open(os.path.join(resume, 'checkpoint', 'config.json')) as f:
+                        kwargs = dict(json.load(f), total_episodes=total_episodes, resume=resume)
+                start = time.perf_counter()
+                with redirect_stdout(devnull):
+                    path = train(TrainConfig(**kwargs))
+                rewards = np.array(read_metrics(os.path.join(path, 'metrics'))['reward'])
+                weights = tf.keras.models.load_model(os.path.join(path, 'lo' if algo == 'HIRO' else '', 'actor'), compile=False).get_weights()
+                return rewards, weights, time.perf_counter() - start
+
+            first, second = run(episodes), run(episodes)
+            stopped = run(episodes - checkpoint_every)
+            resumed = run(episodes, resume=os.path.join(directory, f'{algo}-{TrainConfig().problem}', 'No3'))
+        finally:
+            shutil.rmtree(directory)
+        same = lambda a, b: np.array_equal(a[0], b[0]) and all(np.array_equal(x, y) for x, y in zip(a[1], b[1]))
+        repeated, continued = same(first, second), same(first, resumed)
+        # The stopped run is the first episodes of the full one
+        continued &= np.array_equal(stopped[0], first[0][:len(stopped[0])])
+        print('{:>10} {} episodes {:6.1f} s   repeated run {}   stopped and resumed at episode {} {}'.format(
+            algo, episodes, first[2], 'identical' if repeated else 'DIFFERENT', episodes - checkpoint_every,
+            'identical' if continued else 'DIFFERENT'))
+        if not (repeated and continued):
+            failed.append(algo)
+    if failed:
+        raise SystemExit('seeded runs are not reproducible: {}'.format(failed))
+
+benchmarks = {'buffer': bench_buffer, 'learn': bench_learn, 'targets': bench_targets, 'hiro_step': bench_hiro_step, 'env': bench_env,
+              'train': bench_train, 'td3': bench_td3, 'superbatch': bench_superbatch, 'relabel': bench_relabel, 'segments': bench_segments, 'act': bench_act, 'noise': bench_noise, 'profile': bench_profile, 'retrace': check_retrace, 'wobble': check_wobble, 'obs': bench_obs, 'checkpoint': check_checkpoint, 'export': check_export, 'seed': check_seed}
+
+if __name__ == '__main__':
+    opt, names = gnu_getopt(argv[1:], "", ["Save", "Threshold=", "Baselines="])
+    opt = dict(opt)
+    for name in names or benchmarks:
+        benchmarks[name]()
+
+    path = opt.get('--Baselines', baselines_path)
+    baselines = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            baselines = json.load(f)
+    if '--Save' in opt:
+        # Keys not measured by this run keep their stored baselines
+        baselines.update(results)
+        with open(path, 'w') as f:
+            json.dump(baselines, f, indent=1, sort_keys=True)
+        print('Saved {} baselines to {}'.format(len(results), path))
+    elif results:
+        regressions = compare(baselines, float(opt.get('--Threshold', 0.25)))
+        if regressions:
+            raise SystemExit('{} benchmarks regressed: {}'.format(len(regressions), regressions))
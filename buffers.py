@@ -0,0 +1,541 @@
+"""
+    Replay storage of the algorithms: Buffer (one float64 array per field), PackedBuffer (one contiguous float32
+    block), PrioritizedBuffer (packed, sampled through a SumTree), MemmapBuffer (packed, in a file) and
+    SegmentBuffer and PrioritizedSegmentBuffer (HIRO's high-level segments). PrioritizedReplay adds the
+    SumTree prioritization to either layout. Batches are dicts of float32 tensors, see DDPG.compile_learner.
+"""
+
+import os
+import atexit
+
+import numpy as np
+import tensorflow as tf
+
+from seeding import make_rng
+
+class Buffer:
+    def __init__(self, num_states, num_actions, buffer_capacity=100000, batch_size=64):
+        # Number of "experiences" to store at max
+        self.buffer_capacity = buffer_capacity
+        # Num of tuples to train on.
+        self.batch_size = batch_size
+
+        # Its tells us num of times record() was called.
+        self.buffer_counter = 0
+
+        # Instead of list of tuples as the exp.replay concept go
+        # We use different np.arrays for each tuple element
+        self.state_buffer = np.zeros((self.buffer_capacity, num_states))
+        self.action_buffer = np.zeros((self.buffer_capacity, num_actions))
+        self.reward_buffer = np.zeros((self.buffer_capacity, 1))
+        self.next_state_buffer = np.zeros((self.buffer_capacity, num_states))
+        self.done_buffer = np.zeros((self.buffer_capacity, 1))
+
+        # Uniform sampling needs no importance-sampling correction
+        self.unit_weights = tf.ones((batch_size, 1))
+        self.rng = make_rng('buffer')
+
+    def reset(self):
+        self.buffer_counter = 0
+
+    # Takes (s,a,r,s') obervation tuple as input
+    def record(self, obs_tuple):
+        # Set index to zero if buffer_capacity is exceeded,
+        # replacing old records
+        index = self.buffer_counter % self.buffer_capacity
+
+        self.state_buffer[index] = obs_tuple[0]
+        self.action_buffer[index] = obs_tuple[1]
+        self.reward_buffer[index] = obs_tuple[2]
+        self.next_state_buffer[index] = obs_tuple[3]
+        self.done_buffer[index] = obs_tuple[4]
+
+        self.buffer_counter += 1
+
+    # Takes (s,a,r,s',d) arrays with one row per environment lane
+    def record_batch(self, obs_batch):
+        num = len(obs_batch[0])
+        indices = (self.buffer_counter + np.arange(num)) % self.buffer_capacity
+
+        self.state_buffer[indices] = obs_batch[0]
+        self.action_buffer[indices] = obs_batch[1]
+        self.reward_buffer[indices] = obs_batch[2]
+        self.next_state_buffer[indices] = obs_batch[3]
+        self.done_buffer[indices] = obs_batch[4]
+
+        self.buffer_counter += num
+
+    # Uniform sampling ignores the errors of the last batch
+    def update_priorities(self, td_errors):
+        pass
+
+    # Arrays indexed by ring position, checkpoints copy only the rows recorded since the previous one
+    def ring_arrays(self):
+        return {'states': self.state_buffer, 'actions': self.action_buffer, 'rewards': self.reward_buffer,
+                'next_states': self.next_state_buffer, 'dones': self.done_buffer}
+
+    # Everything else needed to continue
+    def get_state(self):
+        return {'counter': self.buffer_counter, 'rng': self.rng.bit_generator.state}
+
+    def set_state(self, state):
+        self.buffer_counter = state['counter']
+        self.rng.bit_generator.state = state['rng']
+
+    # Return batch of examples, use these for algorithm learning
+    def get_batch(self):
+        # Get sampling range
+        record_range = min(self.buffer_counter, self.buffer_capacity)
+        # Randomly sample indices
+        batch_indices = self.rng.integers(record_range, size=self.batch_size)
+
+        # Convert to float32 tensors, the dtype the learner is compiled for
+        state_batch = tf.convert_to_tensor(self.state_buffer[batch_indices], dtype=tf.float32)
+        action_batch = tf.convert_to_tensor(self.action_buffer[batch_indices], dtype=tf.float32)
+        reward_batch = tf.convert_to_tensor(self.reward_buffer[batch_indices], dtype=tf.float32)
+        next_state_batch = tf.convert_to_tensor(self.next_state_buffer[batch_indices], dtype=tf.float32)
+        done_batch = tf.convert_to_tensor(self.done_buffer[batch_indices], dtype=tf.float32)
+
+        return {
+            'states': state_batch,
+            'actions': action_batch,
+            'rewards': reward_batch,
+            'next_states': next_state_batch,
+            'dones': done_batch,
+            'weights': self.unit_weights
+        }
+
+    # Return 'num_batches' batches from one sample, every field shaped (num_batches, batch_size, width)
+    def get_batches(self, num_batches):
+        record_range = min(self.buffer_counter, self.buffer_capacity)
+        batch_indices = self.rng.integers(record_range, size=(num_batches, self.batch_size))
+
+        return {
+            'states': tf.convert_to_tensor(self.state_buffer[batch_indices], dtype=tf.float32),
+            'actions': tf.convert_to_tensor(self.action_buffer[batch_indices], dtype=tf.float32),
+            'rewards': tf.convert_to_tensor(self.reward_buffer[batch_indices], dtype=tf.float32),
+            'next_states': tf.convert_to_tensor(self.next_state_buffer[batch_indices], dtype=tf.float32),
+            'dones': tf.convert_to_tensor(self.done_buffer[batch_indices], dtype=tf.float32),
+            'weights': tf.ones((num_batches, self.batch_size, 1))
+        }
+
+class PackedBuffer(Buffer):
+    """
+        Keeps every (s,a,r,s',d) row in one contiguous float32 block and gathers batches
+        into preallocated arrays, so the only per-step copy is the single conversion to a tensor.
+    """
+    def __init__(self, num_states, num_actions, buffer_capacity=100000, batch_size=64):
+        self.buffer_capacity = buffer_capacity
+        self.batch_size = batch_size
+        self.buffer_counter = 0
+        self.rng = make_rng('buffer')
+
+        # Column layout of one packed row: state, action, reward, next_state, done
+        self.widths = [num_states, num_actions, 1, num_states, 1]
+        offsets = np.cumsum([0] + self.widths)
+        self.storage = self._allocate_storage(offsets[-1])
+
+        # Column views share the block, so Buffer.record and record_batch write straight into it
+        self.state_buffer, self.action_buffer, self.reward_buffer, self.next_state_buffer, self.done_buffer = \
+            [self.storage[:, start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+        self._allocate_batch(batch_size)
+
+    def _allocate_storage(self, width):
+        return np.zeros((self.buffer_capacity, width), dtype=np.float32)
+
+    def _allocate_batch(self, rows):
+        # Reused on every call to get_batch, resized only when the number of sampled rows changes
+        self._uniform = np.empty(rows)
+        self._indices = np.empty(rows, dtype=np.intp)
+        self._batch = np.empty((rows, self.storage.shape[1]), dtype=np.float32)
+        self.unit_weights = tf.ones((rows, 1))
+
+    def _sample_indices(self):
+        record_range = min(self.buffer_counter, self.buffer_capacity)
+        # Uniform indices in [0, record_range) written in place
+        self.rng.random(out=self._uniform)
+        np.multiply(self._uniform, record_range, out=self._uniform)
+        np.copyto(self._indices, self._uniform, casting='unsafe')
+        return self._indices
+
+    def _gather(self, rows):
+        if len(self._indices) != rows:
+            self._allocate_batch(rows)
+        indices = self._sample_indices()
+        np.take(self.storage, indices, axis=0, out=self._batch)
+        # Single conversion, the fields are column slices of the same float32 tensor
+        return tf.convert_to_tensor(self._batch)
+
+    # Importance-sampling weights of the rows just gathered
+    def _batch_weights(self):
+        return self.unit_weights
+
+    def ring_arrays(self):
+        return {'storage': self.storage}
+
+    def get_batch(self):
+        batch = self._gather(self.batch_size)
+        states, actions, rewards, next_states, dones = tf.split(batch, self.widths, axis=1)
+
+        return {
+            'states': states,
+            'actions': actions,
+            'rewards': rewards,
+            'next_states': next_states,
+            'dones': dones,
+            'weights': self._batch_weights()
+        }
+
+    def get_batches(self, num_batches):
+        # One gather of num_batches * batch_size rows
+        shape = (num_batches, self.batch_size, -1)
+        batch = tf.reshape(self._gather(num_batches * self.batch_size), shape)
+        states, actions, rewards, next_states, dones = tf.split(batch, self.widths, axis=2)
+
+        return {
+            'states': states,
+            'actions': actions,
+            'rewards': rewards,
+            'next_states': next_states,
+            'dones': dones,
+            'weights': tf.reshape(self._batch_weights(), shape)
+        }
+
+class SegmentBuffer:
+    """
+        High-level HIRO replay as a ring of whole segments in preallocated (capacity, period, dim) arrays:
+        the low-level states, goals, actions and rewards of up to 'period' steps, the final state and not_done.
+        Memory is fixed at construction. Sampled rows are (s_0, goal, sum of rewards, s_final, not_done), with
+        'relabel(states, goals, seq_states, seq_actions, lengths, final_states)' choosing the goals to train on.
+        Segments are only added with record_segment, sampling and checkpoints work as for Buffer.
+    """
+    def __init__(self, num_states, num_actions, buffer_capacity=2000, batch_size=64,
+                 num_lo_actions=1, period=20, relabel=None):
+        self.buffer_capacity = buffer_capacity
+        self.batch_size = batch_size
+        self.buffer_counter = 0
+        self.period = period
+        self.relabel = relabel
+        self.rng = make_rng('buffer')
+
+        self.seq_states = np.zeros((buffer_capacity, period, num_states), dtype=np.float32)
+        self.seq_goals = np.zeros((buffer_capacity, period, num_actions), dtype=np.float32)
+        self.seq_actions = np.zeros((buffer_capacity, period, num_lo_actions), dtype=np.float32)
+        self.seq_rewards = np.zeros((buffer_capacity, period), dtype=np.float32)
+        self.lengths = np.zeros(buffer_capacity, dtype=int)
+        self.final_states = np.zeros((buffer_capacity, num_states), dtype=np.float32)
+        self.not_dones = np.zeros((buffer_capacity, 1), dtype=np.float32)
+
+    # Takes one segment, steps past 'length' are ignored
+    def record_segment(self, seq_states, seq_goals, seq_actions, seq_rewards, length, final_state, not_done):
+        index = self.buffer_counter % self.buffer_capacity
+
+        # Copies into the ring, nothing is allocated per segment
+        self.seq_states[index] = seq_states
+        self.seq_goals[index] = seq_goals
+        self.seq_actions[index] = seq_actions
+        self.seq_rewards[index, :length] = seq_rewards[:length]
+        self.seq_rewards[index, length:] = 0
+        self.lengths[index] = length
+        self.final_states[index] = final_state
+        self.not_dones[index] = not_done
+
+        self.buffer_counter += 1
+
+    def ring_arrays(self):
+        return {'seq_states': self.seq_states, 'seq_goals': self.seq_goals, 'seq_actions': self.seq_actions,
+                'seq_rewards': self.seq_rewards, 'lengths': self.lengths, 'final_states': self.final_states,
+                'not_dones': self.not_dones}
+
+    def reset(self):
+        self.buffer_counter = 0
+
+    # Uniform sampling ignores the errors of the last batch
+    def update_priorities(self, td_errors):
+        pass
+
+    def get_state(self):
+        return {'counter': self.buffer_counter, 'rng': self.rng.bit_generator.state}
+
+    def set_state(self, state):
+        self.buffer_counter = state['counter']
+        self.rng.bit_generator.state = state['rng']
+
+    def _sample_indices(self, rows):
+        record_range = min(self.buffer_counter, self.buffer_capacity)
+        return self.rng.integers(record_range, size=rows)
+
+    # Importance-sampling weights of the segments just sampled
+    def _batch_weights(self, indices):
+        return np.ones(len(indices))
+
+    def _sample(self, shape):
+        batch_indices = self._sample_indices(int(np.prod(shape)))
+
+        seq_states = self.seq_states[batch_indices]
+        states = seq_states[:, 0]
+        goals = self.seq_goals[batch_indices, 0]
+        rewards = np.sum(self.seq_rewards[batch_indices], 1)
+        next_states = self.final_states[batch_indices]
+        if self.relabel is not None:
+            goals = self.relabel(states, goals, seq_states, self.seq_actions[batch_indices], self.lengths[batch_indices], next_states)
+
+        fields = states, goals, rewards, next_states, self.not_dones[batch_indices]
+        keys = 'states', 'actions', 'rewards', 'next_states', 'dones'
+        batch = {key: tf.convert_to_tensor(np.reshape(field, shape + (-1,)), dtype=tf.float32) for key, field in zip(keys, fields)}
+        batch['weights'] = tf.convert_to_tensor(np.reshape(self._batch_weights(batch_indices), shape + (1,)), dtype=tf.float32)
+        return batch
+
+    def get_batch(self):
+        return self._sample((self.batch_size,))
+
+    def get_batches(self, num_batches):
+        # Relabeling runs once for the whole super-batch
+        return self._sample((num_batches, self.batch_size))
+
+class SumTree:
+    """
+        Array-based binary sum tree over 'capacity' leaves. Node i has children 2i and 2i+1,
+        the root is node 1 and leaf j is node size+j. Updates and searches handle a whole batch per tree level.
+    """
+    def __init__(self, capacity):
+        self.depth = int(np.ceil(np.log2(max(capacity, 2))))
+        self.size = 2 ** self.depth
+        self.tree = np.zeros(2 * self.size)
+
+    def total(self):
+        return self.tree[1]
+
+    def get(self, indices):
+        return self.tree[indices + self.size]
+
+    def update(self, indices, priorities):
+        nodes = np.asarray(indices) + self.size
+        self.tree[nodes] = priorities
+        # Recompute every touched parent once per level
+        for _ in range(self.depth):
+            nodes = np.unique(nodes // 2)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, values):
+        # Walk all values down the tree together, going right when past the left subtree's mass
+        nodes = np.ones(len(values), dtype=np.intp)
+        values = np.array(values, dtype=float)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            left_sums = self.tree[left]
+            go_right = values >= left_sums
+            values -= left_sums * go_right
+            nodes = left + go_right
+        return nodes - self.size
+
+class PrioritizedReplay:
+    """
+        Proportional prioritization (Schaul et al. 2016) for a ring buffer, mixed in ahead of the buffer class:
+        a SumTree over the ring slots, stratified sampling from it, importance-sampling weights, TD-error
+        priority updates and their checkpoint state. The buffer keeps its own layout and slot bookkeeping.
+    """
+    def _init_priorities(self, alpha, beta, beta_steps, epsilon):
+        self.tree = SumTree(self.buffer_capacity)
+        self.alpha = alpha
+        self.epsilon = epsilon
+        # Anneal beta to 1 over 'beta_steps' sampled batches
+        self.beta = beta
+        self.beta_increment = (1.0 - beta) / beta_steps
+        # New experiences get the largest priority seen so far, so each is replayed at least once
+        self.max_priority = 1.0
+        self._last_indices = None
+
+    def _add_priorities(self, indices):
+        self.tree.update(indices, self.max_priority)
+
+    def _find_indices(self, uniform, out=None):
+        # One sample from each of len(uniform) equal slices of the total priority mass, 'uniform' is overwritten
+        record_range = min(self.buffer_counter, self.buffer_capacity)
+        rows = len(uniform)
+        uniform += np.arange(rows)
+        uniform *= self.tree.total() / rows
+        # Rounding can walk past the last filled leaf
+        return np.minimum(self.tree.find(uniform), record_range - 1, out=out)
+
+    def _importance_weights(self, indices):
+        # Weights of the slots just sampled, which the next update_priorities refers to
+        self._last_indices = indices
+        record_range = min(self.buffer_counter, self.buffer_capacity)
+        probabilities = self.tree.get(indices) / self.tree.total()
+        weights = (record_range * probabilities) ** -self.beta
+        weights /= weights.max()
+        self.beta = min(1.0, self.beta + self.beta_increment)
+        return weights
+
+    def update_priorities(self, td_errors):
+        priorities = (np.abs(np.reshape(td_errors, -1)) + self.epsilon) ** self.alpha
+        self.tree.update(self._last_indices, priorities)
+        self.max_priority = max(self.max_priority, priorities.max())
+
+    # Priorities change for every sampled slot, so the leaves are saved whole and the tree rebuilt from them
+    def get_state(self):
+        record_range = min(self.buffer_counter, self.buffer_capacity)
+        return dict(super().get_state(), priorities=self.tree.get(np.arange(record_range)),
+                    max_priority=self.max_priority, beta=self.beta)
+
+    def set_state(self, state):
+        super().set_state(state)
+        self.tree.update(np.arange(len(state['priorities'])), state['priorities'])
+        self.max_priority = state['max_priority']
+        self.beta = state['beta']
+
+class PrioritizedBuffer(PrioritizedReplay, PackedBuffer):
+    """
+        Proportional prioritized experience replay on the packed layout.
+        Batches carry 'weights', the importance-sampling corrections applied to the critic loss.
+    """
+    def __init__(self, num_states, num_actions, buffer_capacity=100000, batch_size=64,
+                 alpha=0.6, beta=0.4, beta_steps=100_000, epsilon=1e-6):
+        super().__init__(num_states, num_actions, buffer_capacity, batch_size)
+        self._init_priorities(alpha, beta, beta_steps, epsilon)
+
+    def record(self, obs_tuple):
+        index = self.buffer_counter % self.buffer_capacity
+        super().record(obs_tuple)
+        self._add_priorities([index])
+
+    def record_batch(self, obs_batch):
+        indices = (self.buffer_counter + np.arange(len(obs_batch[0]))) % self.buffer_capacity
+        super().record_batch(obs_batch)
+        self._add_priorities(indices)
+
+    def _sample_indices(self):
+        self.rng.random(out=self._uniform)
+        return self._find_indices(self._uniform, out=self._indices)
+
+    def _batch_weights(self):
+        # The index array is reused by the next gather
+        weights = self._importance_weights(self._indices.copy())
+        return tf.convert_to_tensor(weights.reshape(-1, 1), dtype=tf.float32)
+
+class PrioritizedSegmentBuffer(PrioritizedReplay, SegmentBuffer):
+    """
+        SegmentBuffer sampled in proportion to the TD errors of the high level
+    """
+    def __init__(self, num_states, num_actions, buffer_capacity=2000, batch_size=64, num_lo_actions=1, period=20,
+                 relabel=None, alpha=0.6, beta=0.4, beta_steps=100_000, epsilon=1e-6):
+        super().__init__(num_states, num_actions, buffer_capacity, batch_size, num_lo_actions, period, relabel)
+        self._init_priorities(alpha, beta, beta_steps, epsilon)
+
+    def record_segment(self, *segment):
+        index = self.buffer_counter % self.buffer_capacity
+        super().record_segment(*segment)
+        self._add_priorities([index])
+
+    def _sample_indices(self, rows):
+        return self._find_indices(self.rng.random(rows))
+
+    def _batch_weights(self, indices):
+        return self._importance_weights(indices)
+
+class MemmapBuffer(PackedBuffer):
+    """
+        Packed float32 replay storage in a memory-mapped file, so capacity is bounded by disk rather than RAM
+        and the experiences outlive the process. The file is '<directory>/<name>.buf' (name defaults to
+        '<num_states>x<num_actions>', which keeps HIRO's two levels apart) and starts with a small header.
+        Reopening an existing file continues from its stored counter, other processes can read it with 'readonly'.
+    """
+    header_dtype = np.dtype([('magic', 'S8'), ('capacity', '<i8'), ('counter', '<i8'),
+                             ('num_states', '<i8'), ('num_actions', '<i8'), ('dtype', 'S8')])
+    header_size = 64
+    magic = b'HIROBUF1'
+
+    def __init__(self, num_states, num_actions, buffer_capacity=100000, batch_size=64,
+                 directory='replay', name=None, readonly=False, flush_every=10_000):
+        self.path = os.path.join(directory, f'{name or f"{num_states}x{num_actions}"}.buf')
+        self.readonly = readonly
+        self.flush_every = flush_every
+        self.header = self._open_header(num_states, num_actions, buffer_capacity, directory)
+
+        super().__init__(num_states, num_actions, int(self.header['capacity'][0]), batch_size)
+        self.buffer_counter = int(self.header['counter'][0])
+        self._last_flush = self.buffer_counter
+        if not readonly:
+            atexit.register(self.flush)
+
+    @classmethod
+    def open(cls, path, batch_size=64, readonly=True):
+        # Open an existing file without knowing its shape, e.g. from an analysis or learner process
+        header = np.fromfile(path, dtype=cls.header_dtype, count=1)[0]
+        directory, fname = os.path.split(path)
+        return cls(int(header['num_states']), int(header['num_actions']), int(header['capacity']), batch_size,
+                   directory=directory, name=os.path.splitext(fname)[0], readonly=readonly)
+
+    def _open_header(self, num_states, num_actions, capacity, directory):
+        width = 2 * num_states + num_actions + 2
+        if not os.path.exists(self.path):
+            if self.readonly:
+                raise FileNotFoundError(self.path)
+            os.makedirs(directory, exist_ok=True)
+            # Sparse file, pages only take up disk once they are written
+            with open(self.path, 'wb') as f:
+                f.truncate(self.header_size + capacity * width * 4)
+            header = np.memmap(self.path, dtype=self.header_dtype, mode='r+', shape=(1,))
+            header[0] = (self.magic, capacity, 0, num_states, num_actions, b'float32')
+            header.flush()
+            return header
+
+        header = np.memmap(self.path, dtype=self.header_dtype, mode='r' if self.readonly else 'r+', shape=(1,))
+        if header['magic'][0] != self.magic:
+            raise ValueError(f'{self.path} is not a replay buffer file')
+        if (header['num_states'][0], header['num_actions'][0]) != (num_states, num_actions):
+            raise ValueError('{} holds {}x{} experiences, expected {}x{}'.format(
+                self.path, header['num_states'][0], header['num_actions'][0], num_states, num_actions))
+
+        # The ring can only grow while it has not wrapped around yet
+        stored = int(header['capacity'][0])
+        if capacity > stored and not self.readonly and header['counter'][0] <= stored:
+            with open(self.path, 'r+b') as f:
+                f.truncate(self.header_size + capacity * width * 4)
+            header['capacity'] = capacity
+            header.flush()
+        return header
+
+    def _allocate_storage(self, width):
+        mode = 'r' if self.readonly else 'r+'
+        return np.memmap(self.path, dtype=np.float32, mode=mode, offset=self.header_size,
+                         shape=(self.buffer_capacity, width))
+
+    def _sync_counter(self):
+        # Rows are written before the counter moves, so readers never see unwritten rows
+        self.header['counter'] = self.buffer_counter
+        if self.buffer_counter - self._last_flush >= self.flush_every:
+            self.flush()
+
+    def record(self, obs_tuple):
+        super().record(obs_tuple)
+        self._sync_counter()
+
+    def record_batch(self, obs_batch):
+        super().record_batch(obs_batch)
+        self._sync_counter()
+
+    # The rows already live in the replay file, checkpoints only keep the counter
+    def ring_arrays(self):
+        return {}
+
+    def set_state(self, state):
+        super().set_state(state)
+        self._sync_counter()
+
+    def refresh(self):
+        # Pick up experiences written by another process
+        self.buffer_counter = int(self.header['counter'][0])
+
+    def flush(self):
+        if self.readonly: return
+        self.storage.flush()
+        self.header.flush()
+        self._last_flush = self.buffer_counter
+
+# Replay storage layouts selectable with --Buffer
+buffer_types = {'uniform': Buffer, 'packed': PackedBuffer, 'prioritized': PrioritizedBuffer, 'memmap': MemmapBuffer}
+# HIRO's high-level storage for each row layout of the low level, segments are kept in memory only
+segment_buffer_types = {Buffer: SegmentBuffer, PackedBuffer: SegmentBuffer, PrioritizedBuffer: PrioritizedSegmentBuffer}
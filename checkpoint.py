@@ -0,0 +1,134 @@
+"""
+    Periodic checkpoints of a training run, so an interrupted or preempted run can continue with --Resume.
+    Networks, targets and optimizers are a tf.train.Checkpoint, the replay buffers are .npy files that only receive
+    the rows recorded since the previous checkpoint, and the rest (noise, triggers, counters, loop progress) is pickled.
+    Every save copies what it needs on the calling thread and writes it from a background thread.
+"""
+
+import os
+import json
+import pickle
+import threading
+
+import numpy as np
+import tensorflow as tf
+
+class Checkpointer:
+    """
+        Checkpoints 'algo' (anything with trackables/build_optimizers/buffers/get_state/set_state) into 'directory'.
+        Variables and state alternate between two slots and 'checkpoint.json' is replaced last, so a write that is
+        cut short leaves the previous checkpoint intact. Replay rows are shared by both slots: after the ring wraps,
+        an unfinished write may already have replaced some of the oldest rows with newer experiences.
+    """
+    def __init__(self, directory, algo):
+        self.directory = directory
+        self.algo = algo
+        os.makedirs(directory, exist_ok=True)
+
+        # Slots of optimizers that have not updated yet (HIRO's high level while pretraining) must exist on both sides
+        algo.build_optimizers()
+        self.variables = tf.train.Checkpoint(**algo.trackables())
+        # TensorFlow copies the variables during write() and saves the copies in its own thread
+        self.options = tf.train.CheckpointOptions(experimental_enable_async_checkpoint=True)
+        # Buffer counter already covered by the replay files, per buffer
+        self.saved_rows = {}
+        self.replay_files = {}
+        self.slot = 0
+        self.thread = None
+        self.error = None
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _new_rows(self, name, buffer):
+        # Ring rows recorded since the last checkpoint, at most one full ring
+        counter = buffer.buffer_counter
+        start = max(self.saved_rows.get(name, 0), counter - buffer.buffer_capacity)
+        indices = np.arange(start, counter) % buffer.buffer_capacity
+        self.saved_rows[name] = counter
+        return indices, {key: array[indices] for key, array in buffer.ring_arrays().items()}
+
+    def _replay_file(self, name, key, array):
+        # Same shape and dtype as the ring array, created on first use
+        path = self._path(f'replay-{name}-{key}.npy')
+        if path not in self.replay_files:
+            if os.path.exists(path):
+                self.replay_files[path] = np.load(path, mmap_mode='r+')
+            else:
+                self.replay_files[path] = np.lib.format.open_memmap(path, 'w+', array.dtype, array.shape)
+        return self.replay_files[path]
+
+    def save(self, progress):
+        """
+            Start a checkpoint of the algorithm and 'progress' (picklable training loop state).
+            Returns once everything is copied, the files are written in the background.
+        """
+        self.wait()
+        self.slot = 1 - self.slot
+        self.variables.write(self._path(f'vars-{self.slot}'), options=self.options)
+
+        buffers = self.algo.buffers()
+        rows = {name: self._new_rows(name, buffer) for name, buffer in buffers.items()}
+        files = {name: {key: self._replay_file(name, key, array) for key, array in buffer.ring_arrays().items()}
+                 for name, buffer in buffers.items()}
+        state = {'algo': self.algo.get_state(), 'buffers': {name: buffer.get_state() for name, buffer in buffers.items()},
+                 'numpy': np.random.get_state(), 'progress': progress}
+        counters = {name: buffer.buffer_counter for name, buffer in buffers.items()}
+
+        self.thread = threading.Thread(target=self._write, args=(self.slot, rows, files, state, counters))
+        self.thread.start()
+
+    def _write(self, slot, rows, files, state, counters):
+        try:
+            for name, (indices, arrays) in rows.items():
+                for key, array in arrays.items():
+                    files[name][key][indices] = array
+                    files[name][key].flush()
+            with open(self._path(f'state-{slot}.pkl'), 'wb') as f:
+                pickle.dump(state, f)
+            self.variables.sync()
+
+            # The checkpoint only counts once this file is replaced
+            tmp = self._path('checkpoint.json.tmp')
+            with open(tmp, 'w') as f:
+                json.dump({'slot': slot, 'counters': counters, 'episode': state['progress'].get('episode')}, f)
+            os.replace(tmp, self._path('checkpoint.json'))
+        except BaseException as e:
+            self.error = e
+
+    def wait(self):
+        # Finish the write in progress, errors surface here instead of being lost in the thread
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def restore(self):
+        """
+            Load the latest checkpoint into the algorithm and its buffers, returns the saved progress.
+        """
+        with open(self._path('checkpoint.json')) as f:
+            meta = json.load(f)
+        self.slot = meta['slot']
+
+        self.variables.read(self._path(f'vars-{self.slot}')).assert_existing_objects_matched().expect_partial()
+        with open(self._path(f'state-{self.slot}.pkl'), 'rb') as f:
+            state = pickle.load(f)
+
+        for name, buffer in self.algo.buffers().items():
+            counter = meta['counters'][name]
+            used = min(counter, buffer.buffer_capacity)
+            for key, array in buffer.ring_arrays().items():
+                array[:used] = np.load(self._path(f'replay-{name}-{key}.npy'), mmap_mode='r')[:used]
+            buffer.set_state(state['buffers'][name])
+            self.saved_rows[name] = counter
+
+        self.algo.set_state(state['algo'])
+        np.random.set_state(state['numpy'])
+        return state['progress']
+
+    def close(self):
+        self.wait()
+        self.replay_files = {}
@@ -0,0 +1,105 @@
+"""
+    Everything a training run depends on. TrainConfig is built from the command line (from_args), from the checkpoint
+    of a run (from_run) or from keyword arguments (sweep.py). This module loads neither TensorFlow nor the
+    environments, so launchers and analysis scripts can read and compare configurations quickly.
+"""
+
+import json
+from getopt import getopt
+
+envs_pyb = ["InvertedPendulumBulletEnv-v0",
+            "CartPoleContinuousBulletEnv-v0",
+            "CartPoleWobbleContinuousEnv-v0",
+            "ReacherBulletEnv-v0"]
+
+class TrainConfig:
+    """
+        Everything a training run depends on, built from the command line by from_args or directly by sweep.py
+    """
+    options = ["TD3", "FusedTD3", "HIRO", "ActorNN=", "CriticNN=", "NumEnvs=", "Async", "Actors=", "UTD=", "Buffer=", "ReplayDir=", "JIT", "SuperBatch=",
+               "Render=", "Verbose", "LogInterval=", "Problem=", "CheckpointEvery=", "Resume=", "Seed=", "Profile=", "Trace="]
+    # Options that may be given together with --Resume
+    resume_options = ["--Render", "--Verbose", "--LogInterval", "--CheckpointEvery", "--Profile", "--Trace"]
+
+    def __init__(self, algo="DDPG", actor_nn=32, critic_nn=32, problem=envs_pyb[2], num_envs=1, use_async=False, num_actors=1,
+                 utd=None, super_batch=1, buffer='uniform', replay_dir=None, jit=False, total_episodes=2_000, seed=None,
+                 render=5, verbose=False, log_interval=1.0, model_dir='models', checkpoint_every=50, resume=None,
+                 profile_every=0, trace=None):
+        if use_async and algo == "HIRO":
+            raise ValueError("Asynchronous training supports DDPG and TD3 only")
+        self.algo = algo
+        self.actor_nn = actor_nn
+        self.critic_nn = critic_nn
+        self.problem = problem
+        # Number of environment copies stepped in parallel (one worker process each)
+        self.num_envs = num_envs
+        # Asynchronous mode: actor threads step their own environments while this process learns
+        self.use_async = use_async
+        self.num_actors = num_actors if use_async else 1
+        # Gradient updates per environment transition, synchronous runs default to one update per vector step
+        self.utd = utd if utd is not None else (1.0 if use_async else 1.0 / num_envs)
+        # Updates are run K at a time, from one sampled super-batch in a single graph call
+        self.super_batch = super_batch
+        # Replay storage layout, one of buffer_types
+        self.buffer = buffer
+        # Disk-backed replay lives in the run folder unless 'replay_dir' is given, which a later run can reopen to warm-start
+        self.replay_dir = replay_dir
+        self.jit = jit
+        self.total_episodes = total_episodes
+        self.seed = seed
+        # Show lane 0 every 'render' episodes, 0 (or False) runs headless
+        self.render = int(render)
+        # Verbose also logs every target change, log lines are written in bursts every 'log_interval' seconds
+        self.verbose = verbose
+        self.log_interval = log_interval
+        self.model_dir = model_dir
+        # Checkpoint every 'checkpoint_every' episodes (0 disables), 'resume' is the run folder to continue
+        self.checkpoint_every = checkpoint_every
+        self.resume = resume
+        # Report stage timings every 'profile_every' episodes (0 disables), 'trace' is a [first, last) episode range
+        # recorded with tf.profiler
+        self.profile_every = profile_every
+        self.trace = list(trace) if trace else None
+
+    @classmethod
+    def from_args(cls, args):
+        opt, _ = getopt(args, "", cls.options)
+        opt = dict(opt)
+
+        # A resumed run keeps the configuration it was started with, only how it is shown, logged, checkpointed
+        # and profiled can change
+        if "--Resume" in opt:
+            config = cls.from_run(opt.pop('--Resume'))
+            fixed = sorted(set(opt) - set(cls.resume_options))
+            if fixed:
+                raise SystemExit('{} cannot be changed when resuming, the run keeps its configuration'.format(', '.join(fixed)))
+            if '--Render' in opt: config.render = int(opt['--Render'])
+            if '--Verbose' in opt: config.verbose = True
+            if '--LogInterval' in opt: config.log_interval = float(opt['--LogInterval'])
+            if '--CheckpointEvery' in opt: config.checkpoint_every = int(opt['--CheckpointEvery'])
+            if '--Profile' in opt: config.profile_every = int(opt['--Profile'])
+            if '--Trace' in opt: config.trace = [int(e) for e in opt['--Trace'].split(',')]
+            return config
+
+        algo = "DDPG"
+        if "--TD3" in opt: algo = "TD3"
+        if "--FusedTD3" in opt: algo = "FusedTD3"
+        if "--HIRO" in opt: algo = "HIRO"
+        try:
+            return cls(algo, int(opt.get('--ActorNN',32)), int(opt.get('--CriticNN',32)), problem=opt.get('--Problem', envs_pyb[2]),
+                       num_envs=int(opt.get('--NumEnvs',1)), use_async="--Async" in opt, num_actors=int(opt.get('--Actors',1)),
+                       utd=float(opt['--UTD']) if '--UTD' in opt else None, super_batch=int(opt.get('--SuperBatch',1)),
+                       buffer=opt.get('--Buffer','uniform'), replay_dir=opt.get('--ReplayDir'), jit="--JIT" in opt,
+                       render=int(opt.get('--Render',5)), verbose="--Verbose" in opt, log_interval=float(opt.get('--LogInterval',1.0)),
+                       checkpoint_every=int(opt.get('--CheckpointEvery',50)), seed=int(opt['--Seed']) if '--Seed' in opt else None,
+                       profile_every=int(opt.get('--Profile',0)), trace=[int(e) for e in opt['--Trace'].split(',')] if '--Trace' in opt else None)
+        except ValueError as e:
+            raise SystemExit(str(e))
+
+    @classmethod
+    def from_run(cls, path):
+        with open(f'{path}/checkpoint/config.json') as f:
+            return cls(**dict(json.load(f), resume=path))
+
+    def to_dict(self):
+        return dict(vars(self))
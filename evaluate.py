@@ -0,0 +1,225 @@
+"""
+    Evaluation of saved actors without exploration noise.
+        python evaluate.py models/TD3-CartPoleWobbleContinuousEnv-v0/No3 --Episodes=100 --NumEnvs=16 --Seed=0
+        python evaluate.py models --Workers=8 --Threads=1
+    A run folder (one with a saved actor) is evaluated directly, any other folder is searched for runs which are
+    evaluated in parallel, one process per run. The episodes are split over --NumEnvs lanes and each step acts for
+    every lane with one batched actor call. --Problem evaluates on another environment, e.g. CartPoleWobbleNumpy-v0.
+    Results are written to <run>/evaluation.json, runs already evaluated with the same settings are skipped.
+"""
+
+import os
+import json
+import time
+import multiprocessing as mp
+from getopt import gnu_getopt
+from sys import argv
+
+import numpy as np
+import tensorflow as tf
+
+from ECE239AS_Envs import CartPoleWobbleVecEnv, DummyVecEnv, make_vec_env
+from ECE239AS_Envs.cartpole_wobble_numpy import id as numpy_id
+from algorithms import HIRO
+from workers import init_worker
+
+def load_actor(path):
+    # Inference only, one trace for any number of lanes
+    actor = tf.keras.models.load_model(path, compile=False)
+    spec = tf.TensorSpec((None,) + tuple(actor.input_shape[1:]), tf.float32)
+    return tf.function(lambda states: actor(states, training=False), input_signature=[spec])
+
+class ActorPolicy:
+    """
+        Deterministic actions of a saved DDPG/TD3 actor
+    """
+    def __init__(self, path, num_envs):
+        self.act = load_actor(f'{path}/actor')
+
+    def reset(self, dones):
+        pass
+
+    def __call__(self, states):
+        return self.act(states).numpy()
+
+class HIROPolicy:
+    """
+        Deterministic actions of a saved HIRO run: a new goal from the high-level actor every 'period' steps,
+        transitioned so the target state (state + goal) stays fixed, as HIRO.policy_batch does without noise
+    """
+    def __init__(self, path, num_envs):
+        self.act_lo = load_actor(f'{path}/lo/actor')
+        self.act_hi = load_actor(f'{path}/hi/actor')
+        self.steps = np.zeros(num_envs, dtype=int)
+        self.targets = None
+
+    def reset(self, dones):
+        self.steps[dones] = 0
+
+    def __call__(self, states):
+        if self.targets is None:
+            self.targets = np.zeros_like(states)
+        new = self.steps % HIRO.period == 0
+        if new.any():
+            self.targets[new] = states[new] + self.act_hi(states).numpy()[new]
+        self.steps += 1
+        goals = (self.targets - states) * HIRO.goal_mask
+        return self.act_lo(np.concatenate([states, goals.astype(np.float32)], 1)).numpy()
+
+def run_config(path):
+    # Saved config of the run, or the algorithm and problem from its folder name for runs that predate it
+    if os.path.exists(os.path.join(path, 'config.json')):
+        with open(os.path.join(path, 'config.json')) as f:
+            return json.load(f)
+    algo, problem = os.path.basename(os.path.dirname(os.path.abspath(path))).split('-', 1)
+    return dict(algo=algo, problem=problem)
+
+def is_run(path):
+    return os.path.isdir(os.path.join(path, 'actor')) or os.path.isdir(os.path.join(path, 'lo', 'actor'))
+
+def find_runs(model_dir):
+    runs = []
+    for folder, dirs, _ in os.walk(model_dir):
+        if is_run(folder):
+            runs.append(folder)
+            dirs[:] = []
+    return sorted(runs)
+
+def make_env(problem, num_envs, subprocess=True):
+    # Pool workers are daemonic and cannot start environment processes of their own
+    if subprocess:
+        return make_vec_env(problem, num_envs)
+    if problem == numpy_id:
+        return CartPoleWobbleVecEnv(num_envs)
+    return DummyVecEnv(problem, num_envs)
+
+def evaluate(path, episodes=100, num_envs=16, seed=0, problem=None, subprocess=True):
+    """
+        Returns and inference latency of 'episodes' noise-free episodes of the run saved in 'path'.
+        Lane i runs episodes i, i + num_envs, ... from seed + i, so results do not depend on the order lanes finish in.
+    """
+    config = run_config(path)
+    problem = problem or config['problem']
+    num_envs = min(num_envs, episodes)
+    policy = (HIROPolicy if config['algo'] == 'HIRO' else ActorPolicy)(path, num_envs)
+
+    env = make_env(problem, num_envs, subprocess)
+    env.seed(seed)
+    quota = np.full(num_envs, episodes // num_envs)
+    quota[:episodes % num_envs] += 1
+    returns, lengths = [[] for _ in range(num_envs)], [[] for _ in range(num_envs)]
+    episode_returns = np.zeros(num_envs)
+    episode_lengths = np.zeros(num_envs, dtype=int)
+    latencies = []
+
+    start = time.perf_counter()
+    states = np.asarray(env.reset(), dtype=np.float32)
+    try:
+        # Lanes that are done with their episodes keep stepping with the rest, their episodes are not counted
+        while any(len(lane) < n for lane, n in zip(returns, quota)):
+            act_start = time.perf_counter()
+            actions = policy(states)
+            latencies.append(time.perf_counter() - act_start)
+
+            states, rewards, dones, _ = env.step(actions)
+            states = np.asarray(states, dtype=np.float32)
+            episode_returns += rewards
+            episode_lengths += 1
+            for i in np.flatnonzero(dones):
+                if len(returns[i]) < quota[i]:
+                    returns[i].append(episode_returns[i])
+                    lengths[i].append(episode_lengths[i])
+                episode_returns[i] = 0
+                episode_lengths[i] = 0
+            policy.reset(dones)
+    finally:
+        env.close()
+    seconds = time.perf_counter() - start
+
+    returns = np.concatenate(returns)
+    lengths = np.concatenate(lengths)
+    # The first calls trace the actor
+    latencies = np.array(latencies[2:] or latencies) * 1e3
+    return {'run': path, 'algo': config['algo'], 'actor_nn': config.get('actor_nn'), 'critic_nn': config.get('critic_nn'),
+            'seed': config.get('seed'), 'problem': problem, 'episodes': episodes, 'num_envs': num_envs, 'eval_seed': seed,
+            'return_mean': float(np.mean(returns)), 'return_std': float(np.std(returns)), 'return_min': float(np.min(returns)),
+            'return_median': float(np.median(returns)), 'return_max': float(np.max(returns)), 'length_mean': float(np.mean(lengths)),
+            'latency_ms_p50': float(np.percentile(latencies, 50)), 'latency_ms_p90': float(np.percentile(latencies, 90)),
+            'latency_ms_p99': float(np.percentile(latencies, 99)), 'steps_per_sec': float(np.sum(lengths) / seconds),
+            'seconds': seconds}
+
+def _settings(result):
+    return result['episodes'], result['num_envs'], result['eval_seed'], result['problem']
+
+def _evaluate(args):
+    path, kwargs = args
+    try:
+        result = evaluate(path, subprocess=False, **kwargs)
+        with open(os.path.join(path, 'evaluation.json'), 'w') as f:
+            json.dump(result, f, indent=1)
+        return path, result, None
+    except Exception as e:
+        return path, None, repr(e)
+
+def evaluate_dir(model_dir, workers=None, threads=1, **kwargs):
+    """
+        Evaluate every saved run under 'model_dir', 'workers' runs at a time. Returns the results and the number of failures.
+    """
+    workers = workers or max(1, os.cpu_count() // threads)
+    settings = (kwargs.get('episodes', 100), min(kwargs.get('num_envs', 16), kwargs.get('episodes', 100)), kwargs.get('seed', 0))
+
+    results, pending = [], []
+    for path in find_runs(model_dir):
+        saved = os.path.join(path, 'evaluation.json')
+        if os.path.exists(saved):
+            with open(saved) as f:
+                result = json.load(f)
+            if _settings(result) == settings + (kwargs.get('problem') or run_config(path)['problem'],):
+                results.append(result)
+                continue
+        pending.append((path, kwargs))
+    print('{} runs, {} already evaluated, {} to evaluate on {} workers x {} threads'.format(
+        len(results) + len(pending), len(results), len(pending), workers, threads))
+
+    failed = 0
+    if not pending:
+        return results, failed
+    pool = mp.get_context('spawn').Pool(workers, init_worker, (threads,), maxtasksperchild=1)
+    try:
+        for i, (path, result, error) in enumerate(pool.imap_unordered(_evaluate, pending), 1):
+            print('[{}/{}] {} -> {}'.format(i, len(pending), path, error or '{:.1f}'.format(result['return_mean'])))
+            if result: results.append(result)
+            failed += error is not None
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        raise SystemExit(1)
+    finally:
+        pool.join()
+    return results, failed
+
+def report(results):
+    print('{:50} {:>9} {:>8} {:>8} {:>8} {:>8} {:>7} {:>7} {:>7}'.format(
+        'run', 'return', 'std', 'min', 'max', 'length', 'p50 ms', 'p90 ms', 'p99 ms'))
+    for r in sorted(results, key=lambda r: r['run']):
+        print('{:50} {:9.2f} {:8.2f} {:8.2f} {:8.2f} {:8.1f} {:7.3f} {:7.3f} {:7.3f}'.format(
+            r['run'], r['return_mean'], r['return_std'], r['return_min'], r['return_max'], r['length_mean'],
+            r['latency_ms_p50'], r['latency_ms_p90'], r['latency_ms_p99']))
+
+if __name__ == '__main__':
+    opt, args = gnu_getopt(argv[1:], "", ["Episodes=", "NumEnvs=", "Seed=", "Problem=", "Workers=", "Threads="])
+    opt = dict(opt)
+    kwargs = dict(episodes=int(opt.get('--Episodes', 100)), num_envs=int(opt.get('--NumEnvs', 16)),
+                  seed=int(opt.get('--Seed', 0)), problem=opt.get('--Problem'))
+    path = args[0] if args else 'models'
+
+    if is_run(path):
+        result = evaluate(path, **kwargs)
+        with open(os.path.join(path, 'evaluation.json'), 'w') as f:
+            json.dump(result, f, indent=1)
+        report([result])
+    else:
+        workers = int(opt['--Workers']) if '--Workers' in opt else None
+        results, failed = evaluate_dir(path, workers, int(opt.get('--Threads', 1)), **kwargs)
+        report(results)
+        raise SystemExit(failed > 0)
@@ -1,28 +1,58 @@
+"""
+    Figures for the report.
+        python figures.py models [--Column=avg_reward] [--Workers=8] [--Every=10] [--Out=figure.png]
+    scans every run under the given folders, averages the curves of each Algo/ActorNN/CriticNN/problem over its seeds
+    and plots the mean with a 95% confidence band. Parsed runs are cached in '<folder>/.runs-index.pkl', keyed by
+    path and modification time, so only new or changed runs are read again. Without arguments it draws the
+    figures of the report from old-models.
+        python figures.py --Profile=models/TD3-CartPoleWobbleContinuousEnv-v0/No3 [--Stat=p99]
+    plots the stage timings of a run trained with --Profile (profiling.py) over its episodes.
+"""
 
+import os
+import json
+import pickle
 from os import listdir
 from os.path import isdir, join
+from concurrent.futures import ProcessPoolExecutor
+from getopt import gnu_getopt
+from sys import argv
 
 import numpy as np
-import matplotlib.pyplot as plt
-import tensorflow as tf
+
+from metrics import read_metrics
+from profiling import read_profile
 
 def model_summary(model_path):
+    # Variable names and shapes from the SavedModel's checkpoint, without loading the model itself
     if not isdir(model_path):
         return
-    model = tf.keras.models.load_model(model_path)
+    import tensorflow as tf
+    variables = tf.train.list_variables(join(model_path, 'variables', 'variables'))
     print('======', model_path, '======')
-    print(model.summary())
+    total = 0
+    for name, shape in variables:
+        # Layer weights only, not optimizer slots or metrics
+        if not name.startswith('layer_with_weights'):
+            continue
+        total += int(np.prod(shape))
+        print('{:70} {}'.format(name, shape))
+    print('Total parameters:', total)
 
-def CartPole(dir, name):
-    path = join(dir, name)
-    files = listdir(path)
-    for fname in files:
+def results_file(path):
+    # Result files of older runs are named after their best average reward
+    for fname in listdir(path):
         try:
-            score = float(fname)
-            break
+            float(fname)
+            return join(path, fname)
         except ValueError:
             pass
-    with open(join(path, fname)) as f:
+
+# matplotlib is imported by the functions that draw, index_runs and aggregate work without it
+def CartPole(dir, name):
+    import matplotlib.pyplot as plt
+    path = join(dir, name)
+    with open(results_file(path)) as f:
         results = np.array([line.split(',') for line in f])
     trials = np.array(results[2:,0], dtype=float)
     avg_reward = np.array(results[2:,2], dtype=float)
@@ -31,15 +61,169 @@ def CartPole(dir, name):
     # model_summary(f'{path}/critic')
     # model_summary(f'{path}/critic2')
 
-# CartPole('old-models', 'DDPG-CartPoleContinuousBulletEnv-v0_No5')
-# CartPole('old-models', 'TD3-CartPoleContinuousBulletEnv-v0_No8')
-# plt.title('CartPoleContinuousBulletEnv')
+def Run(path, column='avg_reward', every=10, label=None):
+    import matplotlib.pyplot as plt
+    # Runs with a metrics log (models/<Algo>-<problem>/NoX), the columns are memory-mapped so only plotted points are read
+    metrics = read_metrics(join(path, 'metrics'))
+    plt.plot(metrics['episode'][::every], metrics[column][::every], label=label or path)
+
+def find_runs(root):
+    # Folders with a metrics log, or an older results file
+    runs = []
+    for folder, dirs, files in os.walk(root):
+        if 'metrics' in dirs:
+            runs.append(folder)
+            dirs[:] = []
+        elif any(_is_number(fname) for fname in files):
+            runs.append(folder)
+    return runs
+
+def _is_number(text):
+    try:
+        float(text)
+        return True
+    except ValueError:
+        return False
+
+def run_mtime(path):
+    # Changes whenever the run logs more episodes or is saved
+    source = join(path, 'metrics', 'reward.bin') if isdir(join(path, 'metrics')) else results_file(path)
+    times = [os.path.getmtime(source)]
+    if os.path.exists(join(path, 'config.json')):
+        times.append(os.path.getmtime(join(path, 'config.json')))
+    return max(times)
+
+def load_run(path):
+    """
+        Configuration and curves of one run: metadata only, no models are loaded
+    """
+    if isdir(join(path, 'metrics')):
+        metrics = read_metrics(join(path, 'metrics'))
+        episodes, rewards, avg_rewards = metrics['episode'], metrics['reward'], metrics['avg_reward']
+        config = {}
+        for config_path in join(path, 'config.json'), join(path, 'checkpoint', 'config.json'):
+            if os.path.exists(config_path):
+                with open(config_path) as f:
+                    config = json.load(f)
+                break
+    else:
+        # Older text results: 'ActorNN, A, CriticNN, C', a header, then 'episode, reward, average'
+        with open(results_file(path)) as f:
+            lines = [line.split(',') for line in f]
+        results = np.array(lines[2:], dtype=float).reshape(-1, 3)
+        episodes, rewards, avg_rewards = results[:, 0], results[:, 1], results[:, 2]
+        name = os.path.basename(os.path.normpath(path))
+        parent = os.path.basename(os.path.dirname(os.path.normpath(path)))
+        # models/<Algo>-<problem>/NoX, or old-models/<Algo>-<problem>_NoX
+        label = parent if name.startswith('No') else name.rsplit('_', 1)[0]
+        algo, problem = label.split('-', 1)
+        config = dict(algo=algo, problem=problem, actor_nn=int(lines[0][1]), critic_nn=int(lines[0][3]))
+
+    key = (config.get('algo'), config.get('actor_nn'), config.get('critic_nn'), config.get('problem'))
+    return {'key': key, 'seed': config.get('seed'), 'finished': os.path.exists(join(path, 'config.json')) or not isdir(join(path, 'metrics')),
+            'episode': np.array(episodes, dtype=np.int32), 'reward': np.array(rewards, dtype=np.float32),
+            'avg_reward': np.array(avg_rewards, dtype=np.float32)}
+
+def index_runs(roots, workers=None):
+    """
+        Every run under 'roots' by path, parsed in parallel and cached per root by path and modification time
+    """
+    runs = {}
+    for root in roots:
+        index_path = join(root, '.runs-index.pkl')
+        index = {}
+        if os.path.exists(index_path):
+            with open(index_path, 'rb') as f:
+                index = pickle.load(f)
+
+        paths = find_runs(root)
+        mtimes = {path: run_mtime(path) for path in paths}
+        stale = [path for path in paths if path not in index or index[path][0] != mtimes[path]]
+        if stale:
+            with ProcessPoolExecutor(workers) as pool:
+                for path, run in zip(stale, pool.map(load_run, stale, chunksize=8)):
+                    index[path] = (mtimes[path], run)
+        print('{}: {} runs, {} read, {} from the index'.format(root, len(paths), len(stale), len(paths) - len(stale)))
+
+        # Runs that were deleted drop out of the index
+        index = {path: index[path] for path in paths}
+        if stale or len(index) != len(paths):
+            with open(index_path + '.tmp', 'wb') as f:
+                pickle.dump(index, f)
+            os.replace(index_path + '.tmp', index_path)
+        runs.update({path: run for path, (_, run) in index.items()})
+    return runs
+
+def aggregate(runs, column='avg_reward'):
+    """
+        Mean and 95% confidence half-width per episode across the seeds of every configuration.
+        Curves of different lengths are averaged over the runs that reached each episode.
+    """
+    groups = {}
+    for run in runs.values():
+        groups.setdefault(run['key'], []).append(run[column])
+
+    curves = {}
+    for key, values in groups.items():
+        length = max(len(v) for v in values)
+        stacked = np.full((len(values), length), np.nan)
+        for i, v in enumerate(values):
+            stacked[i, :len(v)] = v
+        counts = np.sum(~np.isnan(stacked), 0)
+        mean = np.nanmean(stacked, 0)
+        # Sample standard deviation, zero where only one run reached the episode
+        squares = np.nansum((stacked - mean)**2, 0)
+        std = np.sqrt(squares / np.maximum(counts - 1, 1))
+        ci = 1.96 * std / np.sqrt(counts)
+        curves[key] = (mean, ci, len(values))
+    return curves
+
+def plot_curves(curves, every=10):
+    import matplotlib.pyplot as plt
+    for (algo, actor_nn, critic_nn, problem), (mean, ci, num_runs) in sorted(curves.items(), key=lambda item: str(item[0])):
+        episodes = np.arange(len(mean))[::every]
+        line, = plt.plot(episodes, mean[::every], label=f'{algo} A{actor_nn} C{critic_nn} (n={num_runs})')
+        plt.fill_between(episodes, (mean - ci)[::every], (mean + ci)[::every], color=line.get_color(), alpha=0.2)
+
+def Profile(path, stat='p50'):
+    # One line per stage, latencies in microseconds, 'share' in percent of wall time
+    import matplotlib.pyplot as plt
+    episodes, stages = read_profile(path)
+    scale, unit = {'p50': (1e6, 'us'), 'p99': (1e6, 'us'), 'mean': (1e6, 'us'), 'share': (100, '%')}.get(stat, (1, ''))
+    for name, stats in stages.items():
+        plt.plot(episodes, stats[stat] * scale, marker='.', label=name)
+    if stat in ('p50', 'p99', 'mean'):
+        plt.yscale('log')
+    return f'{stat} {unit}'.strip()
+
+if __name__ == '__main__':
+    import matplotlib.pyplot as plt
+    if len(argv) > 1:
+        opt, roots = gnu_getopt(argv[1:], "", ["Column=", "Workers=", "Every=", "Out=", "Profile=", "Stat="])
+        opt = dict(opt)
+        if '--Profile' in opt:
+            ylabel = Profile(opt['--Profile'], opt.get('--Stat', 'p50'))
+        else:
+            ylabel = opt.get('--Column', 'avg_reward')
+            runs = index_runs(roots or ['models'], int(opt['--Workers']) if '--Workers' in opt else None)
+            plot_curves(aggregate(runs, ylabel), int(opt.get('--Every', 10)))
+        plt.xlabel('Episode')
+        plt.ylabel(ylabel)
+        plt.legend()
+        if '--Out' in opt:
+            plt.savefig(opt['--Out'])
+        else:
+            plt.show()
+    else:
+        # CartPole('old-models', 'DDPG-CartPoleContinuousBulletEnv-v0_No5')
+        # CartPole('old-models', 'TD3-CartPoleContinuousBulletEnv-v0_No8')
+        # plt.title('CartPoleContinuousBulletEnv')
 
-CartPole('old-models', 'DDPG-CartPoleWobbleContinuousEnv-v0_No9')
-CartPole('old-models', 'TD3-CartPoleWobbleContinuousEnv-v0_No22')
-plt.title('CartPoleWobbleContinuousEnv')
+        CartPole('old-models', 'DDPG-CartPoleWobbleContinuousEnv-v0_No9')
+        CartPole('old-models', 'TD3-CartPoleWobbleContinuousEnv-v0_No22')
+        plt.title('CartPoleWobbleContinuousEnv')
 
-plt.legend()
-plt.show()
+        plt.legend()
+        plt.show()
 
-# input()
+        # input()
@@ -0,0 +1,75 @@
+"""
+    Buffered, rate-limited logging for long training runs: records are collected in memory and written
+    in one go every 'interval' seconds, so terminal I/O no longer happens on every step or episode.
+    A buffered record is written within 'interval' seconds even if no further record arrives (a long learn
+    phase, or a hang).
+"""
+
+import logging
+import sys
+import time
+import threading
+
+class RateLimitedHandler(logging.Handler):
+    """
+        Writes buffered records at most once per 'interval' seconds, keeping up to 'max_lines' lines per write.
+        Further INFO/DEBUG records are only counted and reported as dropped, warnings and errors are always kept.
+    """
+    def __init__(self, stream=None, interval=1.0, max_lines=50):
+        super().__init__()
+        self.stream = stream or sys.stdout
+        self.interval = interval
+        self.max_lines = max_lines
+        self.lines = []
+        self.dropped = 0
+        self.last_write = time.perf_counter()
+        # Pending write of the buffered records, armed by the first record after a write
+        self.timer = None
+
+    def emit(self, record):
+        # Dropped records are never formatted
+        if len(self.lines) < self.max_lines or record.levelno >= logging.WARNING:
+            self.lines.append(self.format(record))
+        else:
+            self.dropped += 1
+        elapsed = time.perf_counter() - self.last_write
+        if elapsed >= self.interval:
+            self.flush()
+        elif self.timer is None:
+            self.timer = threading.Timer(self.interval - elapsed, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def flush(self):
+        self.acquire()
+        try:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if self.dropped:
+                self.lines.append('    ... {} messages dropped'.format(self.dropped))
+                self.dropped = 0
+            if self.lines:
+                self.stream.write('\n'.join(self.lines) + '\n')
+                self.stream.flush()
+                self.lines = []
+            self.last_write = time.perf_counter()
+        finally:
+            self.release()
+
+    def close(self):
+        self.flush()
+        super().close()
+
+def setup_logging(level=logging.INFO, interval=1.0, max_lines=50, stream=None):
+    # Replaces the handler of a previous run in this process, so repeated runs do not log twice
+    root = logging.getLogger()
+    for handler in [h for h in root.handlers if isinstance(h, RateLimitedHandler)]:
+        root.removeHandler(handler)
+        handler.close()
+
+    handler = RateLimitedHandler(stream, interval, max_lines)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    root.addHandler(handler)
+    root.setLevel(level)
+    return handler
@@ -0,0 +1,114 @@
+"""
+    Append-only, columnar per-episode metrics of a training run: one raw little-endian file per column in
+    '<run>/metrics', written in chunks every 'flush_every' episodes. Readers memory-map the columns (read_metrics),
+    so plotting many runs never parses text. Rows are complete up to the shortest column file.
+"""
+
+import os
+import json
+import time
+
+import numpy as np
+
+# Column name and dtype, NaN where a value does not apply (hi_noise outside HIRO, moves in async runs)
+columns = [('episode', '<i8'), ('reward', '<f8'), ('avg_reward', '<f8'), ('length', '<i8'), ('total_steps', '<i8'),
+           ('move', '<f8'), ('move_mag', '<f8'), ('lo_noise', '<f8'), ('hi_noise', '<f8'),
+           ('steps_per_sec', '<f8'), ('wall_time', '<f8')]
+
+class RollingMean:
+    """
+        Mean of the last 'window' values, updated in O(1) per value
+    """
+    def __init__(self, window=40):
+        self.values = np.zeros(window)
+        self.count = 0
+        self.sum = 0.0
+
+    def add(self, value):
+        index = self.count % len(self.values)
+        self.sum += value - self.values[index]
+        self.values[index] = value
+        self.count += 1
+        return self.sum / min(self.count, len(self.values))
+
+class MetricsLog:
+    """
+        Streams one row per episode to 'directory'. append() also returns the rolling average reward
+        over the last 'window' episodes. An existing log is continued, truncated to 'rows' by set_state.
+    """
+    def __init__(self, directory, flush_every=100, window=40):
+        self.directory = directory
+        self.flush_every = flush_every
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, 'columns.json'), 'w') as f:
+            json.dump(columns, f)
+
+        # Continue after the last complete row
+        self.rows = read_rows(directory)
+        self.files = {name: open(os.path.join(directory, f'{name}.bin'), 'ab') for name, _ in columns}
+        for name, dtype in columns:
+            self.files[name].truncate(self.rows * np.dtype(dtype).itemsize)
+        # Rows waiting for the next flush, one preallocated array per column
+        self.chunk = {name: np.zeros(flush_every, dtype=dtype) for name, dtype in columns}
+        self.pending = 0
+        self.total_steps = 0
+        self.rolling = RollingMean(window)
+
+    def append(self, episode, reward, length, move=np.nan, move_mag=np.nan, lo_noise=np.nan, hi_noise=np.nan, steps_per_sec=np.nan):
+        avg_reward = self.rolling.add(reward)
+        self.total_steps += length
+        row = dict(episode=episode, reward=reward, avg_reward=avg_reward, length=length, total_steps=self.total_steps,
+                   move=move, move_mag=move_mag, lo_noise=lo_noise, hi_noise=hi_noise, steps_per_sec=steps_per_sec,
+                   wall_time=time.time())
+        for name, value in row.items():
+            self.chunk[name][self.pending] = value
+        self.pending += 1
+        self.rows += 1
+        if self.pending == self.flush_every:
+            self.flush()
+        return avg_reward
+
+    def flush(self):
+        if self.pending:
+            for name, _ in columns:
+                self.files[name].write(self.chunk[name][:self.pending].tobytes())
+            self.pending = 0
+        for f in self.files.values():
+            f.flush()
+
+    # Checkpointed with the run, rows past a checkpoint are dropped when resuming from it
+    def get_state(self):
+        self.flush()
+        return {'rows': self.rows, 'total_steps': self.total_steps, 'rolling': (self.rolling.values.copy(), self.rolling.count, self.rolling.sum)}
+
+    def set_state(self, state):
+        self.flush()
+        for name, dtype in columns:
+            self.files[name].truncate(state['rows'] * np.dtype(dtype).itemsize)
+        self.rows = state['rows']
+        self.total_steps = state['total_steps']
+        values, self.rolling.count, self.rolling.sum = state['rolling']
+        self.rolling.values[:] = values
+
+    def close(self):
+        self.flush()
+        for f in self.files.values():
+            f.close()
+
+def read_rows(directory):
+    # Complete rows: a crash can leave the last chunk written to some columns only
+    sizes = [os.path.getsize(os.path.join(directory, f'{name}.bin')) // np.dtype(dtype).itemsize
+             if os.path.exists(os.path.join(directory, f'{name}.bin')) else 0 for name, dtype in columns]
+    return min(sizes)
+
+def read_metrics(directory):
+    """
+        Columns of a metrics log as read-only memory maps (nothing is read until used), keyed by column name
+    """
+    with open(os.path.join(directory, 'columns.json')) as f:
+        stored = json.load(f)
+    rows = read_rows(directory)
+    if rows == 0:
+        return {name: np.zeros(0, dtype=dtype) for name, dtype in stored}
+    return {name: np.memmap(os.path.join(directory, f'{name}.bin'), dtype=dtype, mode='r', shape=(rows,))
+            for name, dtype in stored}
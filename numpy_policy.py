@@ -0,0 +1,97 @@
+"""
+    Trained actors without TensorFlow: export writes the weights of a saved actor to one .npz file, NumpyActor runs it
+    with NumPy only, for any batch of states.
+        python numpy_policy.py models/TD3-CartPoleWobbleContinuousEnv-v0/No3 [--Dtype=float16] [--Out=actor.npz]
+    HIRO runs export their low-level actor. Weights are stored as float32, float16, or int8 with one scale per output
+    unit; NumpyActor expands them to float32 once when loading. Every export is checked against the Keras actor and
+    fails if they disagree by more than the tolerance of its dtype (python benchmark.py export).
+"""
+
+import os
+from getopt import gnu_getopt
+from sys import argv
+
+import numpy as np
+
+# Largest allowed difference from the Keras actor on random states, actions are in [-upper_bound, upper_bound]
+tolerances = {'float32': 1e-5, 'float16': 1e-2, 'int8': 1e-1}
+
+class NumpyActor:
+    """
+        Forward pass of get_actor: two ReLU layers, a tanh output scaled by upper_bound.
+        Takes a state (num_states,) or a batch (batch, num_states), returns float32 actions of the same rank.
+    """
+    def __init__(self, path):
+        with np.load(path) as weights:
+            self.upper_bound = float(weights['upper_bound'])
+            self.layers = []
+            for i in range(3):
+                kernel = weights[f'kernel{i}']
+                if kernel.dtype == np.int8:
+                    kernel = kernel * weights[f'scale{i}']
+                self.layers.append((kernel.astype(np.float32), weights[f'bias{i}'].astype(np.float32)))
+        self.num_states = self.layers[0][0].shape[0]
+        self.num_actions = self.layers[-1][0].shape[1]
+
+    def __call__(self, states):
+        states = np.asarray(states, dtype=np.float32)
+        out = states.reshape(-1, self.num_states)
+        for kernel, bias in self.layers[:-1]:
+            out = out @ kernel
+            out += bias
+            np.maximum(out, 0, out=out)
+        kernel, bias = self.layers[-1]
+        out = out @ kernel
+        out += bias
+        np.tanh(out, out=out)
+        out *= self.upper_bound
+        return out if states.ndim > 1 else out[0]
+
+def quantize(kernel):
+    # Symmetric int8, one scale per output unit
+    scale = np.max(np.abs(kernel), 0, keepdims=True) / 127
+    scale[scale == 0] = 1
+    return np.round(kernel / scale).astype(np.int8), scale.astype(np.float32)
+
+def actor_path(run):
+    # HIRO runs act through their low-level actor
+    return os.path.join(run, 'lo', 'actor') if os.path.isdir(os.path.join(run, 'lo', 'actor')) else os.path.join(run, 'actor')
+
+def export(run, out=None, dtype='float32', upper_bound=1.0, samples=10_000):
+    """
+        Write the actor saved in 'run' (or an actor SavedModel folder) to 'out' and check NumpyActor against it.
+        upper_bound is the action bound the actor was built with, get_env_details always uses 1.0.
+        Returns the output path and the largest difference from the Keras actor.
+    """
+    import tensorflow as tf
+    path = run if os.path.exists(os.path.join(run, 'saved_model.pb')) else actor_path(run)
+    out = out or f'{path}-{dtype}.npz'
+    actor = tf.keras.models.load_model(path, compile=False)
+    kernels, biases = actor.get_weights()[0::2], actor.get_weights()[1::2]
+    if len(kernels) != 3:
+        raise ValueError(f'{path} is not an actor from get_actor')
+
+    weights = {'upper_bound': np.float32(upper_bound)}
+    for i, (kernel, bias) in enumerate(zip(kernels, biases)):
+        if dtype == 'int8':
+            weights[f'kernel{i}'], weights[f'scale{i}'] = quantize(kernel)
+            weights[f'bias{i}'] = bias.astype(np.float32)
+        else:
+            weights[f'kernel{i}'] = kernel.astype(dtype)
+            weights[f'bias{i}'] = bias.astype(dtype)
+    np.savez(out, **weights)
+
+    # States spread well past the observation range, so saturated outputs are compared too
+    states = np.random.default_rng(0).normal(scale=2.0, size=(samples, kernels[0].shape[0])).astype(np.float32)
+    error = float(np.max(np.abs(NumpyActor(out)(states) - actor(states, training=False).numpy())))
+    if error > tolerances[dtype]:
+        os.remove(out)
+        raise ValueError(f'{out}: NumPy actor differs from Keras by {error:.2e} (tolerance {tolerances[dtype]:.0e})')
+    return out, error
+
+if __name__ == '__main__':
+    opt, args = gnu_getopt(argv[1:], "", ["Dtype=", "Out=", "UpperBound="])
+    opt = dict(opt)
+    for run in args:
+        out, error = export(run, opt.get('--Out'), opt.get('--Dtype', 'float32'), float(opt.get('--UpperBound', 1.0)))
+        print('{} -> {} ({} bytes, max difference {:.2e})'.format(run, out, os.path.getsize(out), error))
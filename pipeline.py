@@ -0,0 +1,212 @@
+"""
+    Asynchronous actor/learner training: actor threads step their own environments with a
+    periodically refreshed copy of the actor network while the learner trains on replay batches.
+"""
+
+import logging
+import queue
+import threading
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from profiling import profiler
+
+logger = logging.getLogger(__name__)
+
+class RateMeter:
+    """
+        Counts events and reports the rate since the previous report
+    """
+    def __init__(self):
+        self.total = 0
+        self._count = 0
+        self._last = time.perf_counter()
+
+    def add(self, num=1):
+        self._count += num
+
+    def rate(self):
+        now = time.perf_counter()
+        rate = self._count / max(now - self._last, 1e-9)
+        self.total += self._count
+        self._count = 0
+        self._last = now
+        return rate
+
+class WeightStore:
+    """
+        Latest published actor weights, copied so actors never read a half-applied update
+    """
+    def __init__(self, model):
+        self.lock = threading.Lock()
+        self.version = 0
+        self.weights = model.get_weights()
+
+    def publish(self, model):
+        weights = model.get_weights()
+        with self.lock:
+            self.weights = weights
+            self.version += 1
+
+    def pull(self, model, version):
+        with self.lock:
+            weights, latest = self.weights, self.version
+        if latest != version:
+            model.set_weights(weights)
+        return latest
+
+class ActorThread(threading.Thread):
+    def __init__(self, algo, env, noise, transitions, weights, stop, sync_every=100):
+        super().__init__(daemon=True)
+        # Private copy of the actor so acting never waits on a gradient step
+        self.model = tf.keras.models.clone_model(algo.actor)
+        self.action_bound = algo.action_bound
+        self.env = env
+        self.noise = noise
+        self.transitions = transitions
+        self.weights = weights
+        self.stop = stop
+        self.sync_every = sync_every
+
+        self.meter = RateMeter()
+        self.error = None
+
+    def _put(self, item):
+        # Bounded queue: block while the learner catches up, but notice a stop request
+        while not self.stop.is_set():
+            try:
+                self.transitions.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def run(self):
+        try:
+            self._run()
+        except BaseException as e:
+            self.error = e
+            self.stop.set()
+
+    def _run(self):
+        num_envs = self.env.num_envs
+        version = -1
+        steps = 0
+
+        prev_states = self.env.reset()
+        episodic_rewards = np.zeros(num_envs)
+        lengths = np.zeros(num_envs, dtype=int)
+        while not self.stop.is_set():
+            if steps % self.sync_every == 0:
+                version = self.weights.pull(self.model, version)
+
+            with profiler.stage('policy'):
+                actions = self.action_bound(self.model(prev_states).numpy() + self.noise())
+            with profiler.stage('env.step'):
+                states, rewards, dones, infos = self.env.step(actions)
+            profiler.count('env_steps', num_envs)
+            final_states = np.array(states)
+            for i in np.flatnonzero(dones):
+                final_states[i] = infos[i]['terminal_observation']
+            episodic_rewards += rewards
+            lengths += 1
+
+            # (reward, length, noise) of every episode that just finished
+            episodes = []
+            for i in np.flatnonzero(dones):
+                episodes.append((episodic_rewards[i], lengths[i], np.round(self.noise.std_dev, 2)))
+                episodic_rewards[i] = 0
+                lengths[i] = 0
+                # Decrease noise
+                self.noise.end_episodes([i])
+
+            self._put((prev_states, actions, rewards, final_states, dones, episodes))
+            prev_states = states
+            steps += 1
+            self.meter.add(num_envs)
+
+class AsyncTrainer:
+    """
+        Runs one ActorThread per environment and trains 'algo' from the main thread.
+        'utd' is the update-to-data ratio: gradient updates per environment transition.
+        With 'super_batch' K > 1, updates run K at a time through algo.train_many.
+    """
+    def __init__(self, algo, envs, noises, utd=1.0, super_batch=1, queue_size=64, sync_every=100, publish_every=50, report_every=10.0):
+        self.algo = algo
+        self.utd = utd
+        self.super_batch = super_batch
+        self.publish_every = publish_every
+        self.report_every = report_every
+
+        self.transitions = queue.Queue(maxsize=queue_size)
+        self.weights = WeightStore(algo.actor)
+        self.stop = threading.Event()
+        self.actors = [ActorThread(algo, env, noise, self.transitions, self.weights, self.stop, sync_every)
+                       for env, noise in zip(envs, noises)]
+
+        self.learner_meter = RateMeter()
+        self.num_transitions = 0
+        self.num_updates = 0
+        self.num_episodes = 0
+
+    def _ingest(self, item, on_episode):
+        prev_states, actions, rewards, final_states, dones, episodes = item
+        with profiler.stage('record'):
+            self.algo.record_batch(prev_states, actions, rewards, final_states, dones)
+        self.num_transitions += len(dones)
+        for reward, length, std_dev in episodes:
+            on_episode(self.num_episodes, reward, length, std_dev)
+            self.num_episodes += 1
+
+    def _drain(self, block, on_episode):
+        # Record everything queued so far, waiting briefly only when there is nothing to learn
+        try:
+            item = self.transitions.get(timeout=0.1) if block else self.transitions.get_nowait()
+            while True:
+                self._ingest(item, on_episode)
+                item = self.transitions.get_nowait()
+        except queue.Empty:
+            pass
+
+    def _report(self):
+        actor_rate = sum(actor.meter.rate() for actor in self.actors)
+        learner_rate = self.learner_meter.rate()
+        logger.info('    [async] actors: %7.1f steps/s  learner: %7.1f updates/s  queue: %d/%d',
+                    actor_rate, learner_rate, self.transitions.qsize(), self.transitions.maxsize)
+
+    def run(self, total_episodes, on_episode):
+        for actor in self.actors:
+            actor.start()
+        last_report = time.perf_counter()
+        try:
+            while self.num_episodes < total_episodes and not self.stop.is_set():
+                due = int(self.utd * self.num_transitions) - self.num_updates
+                self._drain(due < self.super_batch, on_episode)
+
+                # Cap each burst so the queue keeps being emptied
+                due = int(self.utd * self.num_transitions) - self.num_updates
+                for _ in range(min(due // self.super_batch, self.transitions.maxsize)):
+                    with profiler.stage('train'):
+                        if self.super_batch == 1:
+                            self.algo.train()
+                        else:
+                            self.algo.train_many(self.super_batch)
+                    profiler.count('updates', self.super_batch)
+                    # Publish when a multiple of publish_every was crossed
+                    if (self.num_updates + self.super_batch) // self.publish_every > self.num_updates // self.publish_every:
+                        self.weights.publish(self.algo.actor)
+                    self.num_updates += self.super_batch
+                    self.learner_meter.add(self.super_batch)
+
+                if time.perf_counter() - last_report > self.report_every:
+                    self._report()
+                    last_report = time.perf_counter()
+        finally:
+            self.stop.set()
+            for actor in self.actors:
+                actor.join()
+
+        for actor in self.actors:
+            if actor.error is not None:
+                raise actor.error
@@ -0,0 +1,157 @@
+"""
+    Timers and counters for the hot path of training. Stages are timed where they run:
+        with profiler.stage('env.step'):
+            states, rewards, dones, infos = env.step(actions)
+        profiler.count('env_steps', num_envs)
+    Disabled (the default) a stage is one attribute check and a shared do-nothing context manager.
+    Enabled, every call's duration is kept until the next report(), which gives per stage the number of calls, p50/p99
+    latency, calls per second and the share of wall time spent in it. Stages nest (learn runs inside train), so shares
+    can add up to more than 100%. train() enables it with --Profile and appends every report to <RUN>/profile.jsonl
+    (read_profile, plotted by 'python figures.py --Profile=<RUN>'). TraceWindow records a tf.profiler trace of a
+    range of episodes for TensorBoard's profile tab.
+"""
+
+import os
+import json
+import time
+from collections import defaultdict
+
+import numpy as np
+
+class _Disabled:
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+_disabled = _Disabled()
+
+class _Timer:
+    __slots__ = ('samples', 'start')
+
+    def __init__(self, samples):
+        self.samples = samples
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        # list.append is atomic, actor threads and the learner can time the same stage
+        self.samples.append(time.perf_counter() - self.start)
+
+class Profiler:
+    """
+        Per-stage durations and named counters since the last report(), collected only while enabled
+    """
+    def __init__(self):
+        self.enabled = False
+        self.reset()
+
+    def enable(self):
+        self.reset()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        self.samples = defaultdict(list)
+        self.counts = defaultdict(int)
+        self.since = time.perf_counter()
+
+    def stage(self, name):
+        if not self.enabled:
+            return _disabled
+        return _Timer(self.samples[name])
+
+    def count(self, name, num=1):
+        if self.enabled:
+            self.counts[name] += num
+
+    def report(self):
+        """
+            Statistics since the previous report, then starts a new window:
+            {'window': seconds, 'stages': {name: {calls, p50, p99, mean (seconds), per_sec, share}}, 'counts': {name: per second}}
+        """
+        samples, counts, since = self.samples, self.counts, self.since
+        self.reset()
+        window = max(self.since - since, 1e-9)
+        stages = {}
+        for name, durations in samples.items():
+            if not durations:
+                continue
+            durations = np.array(durations)
+            p50, p99 = np.percentile(durations, [50, 99])
+            stages[name] = {'calls': len(durations), 'p50': p50, 'p99': p99, 'mean': durations.mean(),
+                            'per_sec': len(durations) / window, 'share': durations.sum() / window}
+        return {'window': window, 'stages': stages, 'counts': {name: num / window for name, num in counts.items()}}
+
+# Shared by the training loop, pipeline and the algorithms, like the logging module's loggers
+profiler = Profiler()
+
+def format_report(report):
+    # Log lines of one report, slowest stages first
+    lines = ['    [profile] {:16} {:>8} {:>10} {:>10} {:>9} {:>6}'.format('stage', 'calls', 'p50 us', 'p99 us', 'calls/s', 'time')]
+    for name, stats in sorted(report['stages'].items(), key=lambda item: -item[1]['share']):
+        lines.append('    [profile] {:16} {:8d} {:10.1f} {:10.1f} {:9.1f} {:5.1f}%'.format(
+            name, stats['calls'], stats['p50'] * 1e6, stats['p99'] * 1e6, stats['per_sec'], stats['share'] * 100))
+    for name, rate in report['counts'].items():
+        lines.append('    [profile] {:16} {:.1f}/s'.format(name, rate))
+    return lines
+
+class ProfileLog:
+    """
+        Appends one JSON line per report to 'path', with the episode it was taken at
+    """
+    def __init__(self, path):
+        self.file = open(path, 'a')
+
+    def append(self, episode, report):
+        self.file.write(json.dumps(dict(report, episode=episode, wall_time=time.time())) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+def read_profile(path):
+    """
+        Reports of a profile.jsonl (or the run folder holding it) as (episodes, {stage: {stat: array}}),
+        NaN where a stage did not run in a report
+    """
+    if os.path.isdir(path):
+        path = os.path.join(path, 'profile.jsonl')
+    with open(path) as f:
+        reports = [json.loads(line) for line in f if line.strip()]
+    episodes = np.array([report['episode'] for report in reports])
+    names = sorted({name for report in reports for name in report['stages']})
+    stats = ('calls', 'p50', 'p99', 'mean', 'per_sec', 'share')
+    stages = {name: {stat: np.array([report['stages'].get(name, {}).get(stat, np.nan) for report in reports], dtype=float)
+                     for stat in stats} for name in names}
+    return episodes, stages
+
+class TraceWindow:
+    """
+        tf.profiler trace of episodes first..last-1 into 'logdir', started and stopped by update(episode)
+    """
+    def __init__(self, logdir, first, last):
+        self.logdir = logdir
+        self.first = first
+        self.last = last
+        self.active = False
+
+    def update(self, episode):
+        import tensorflow as tf
+        if not self.active and self.first <= episode < self.last:
+            tf.profiler.experimental.start(self.logdir)
+            self.active = True
+        elif self.active and episode >= self.last:
+            self.close()
+
+    def close(self):
+        if self.active:
+            import tensorflow as tf
+            tf.profiler.experimental.stop()
+            self.active = False
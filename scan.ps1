@@ -1,12 +1,3 @@
-
-# python .\basicgym.py --TD3 --ActorNN=32 --CriticNN=32
-# python .\basicgym.py --TD3 --ActorNN=64 --CriticNN=32
-# python .\basicgym.py --TD3 --ActorNN=32 --CriticNN=64
-# python .\basicgym.py --TD3 --ActorNN=64 --CriticNN=64
-python .\basicgym.py --TD3 --ActorNN=128 --CriticNN=128
-
-# python .\basicgym.py --ActorNN=32 --CriticNN=32
-# python .\basicgym.py --ActorNN=64 --CriticNN=32
-# python .\basicgym.py --ActorNN=32 --CriticNN=64
-# python .\basicgym.py --ActorNN=64 --CriticNN=64
-python .\basicgym.py --ActorNN=128 --CriticNN=128
+# Runs through sweep.py: every configuration trains in its own process, finished ones are skipped
+# python .\sweep.py --Algos=TD3,DDPG --ActorNN=32,64 --CriticNN=32,64
+python .\sweep.py --Algos=TD3,DDPG --ActorNN=128 --CriticNN=128
@@ -0,0 +1,38 @@
+"""
+    Random streams of a training run, all derived from one run seed. Every component asks for its own stream by name
+    (make_rng('buffer'), seed_int('target_noise')), so streams are independent and adding draws to one component never
+    shifts another. The n-th request for a name gets the n-th stream of that name, which only depends on the order the
+    components are built in. Without a run seed the streams come from OS entropy.
+    The generators' states are saved by the components that own them (get_state or trackables), see checkpoint.py.
+"""
+
+import zlib
+
+import numpy as np
+
+_run_seed = None
+# Streams handed out so far, by name
+_requests = {}
+
+def set_run_seed(seed):
+    global _run_seed
+    _run_seed = seed
+    _requests.clear()
+
+def new_seed():
+    # For runs started without a seed, recorded in their config so they can be repeated
+    return int(np.random.SeedSequence().generate_state(1)[0] >> 1)
+
+def seed_sequence(name):
+    index = _requests.get(name, 0)
+    _requests[name] = index + 1
+    if _run_seed is None:
+        return np.random.SeedSequence()
+    return np.random.SeedSequence(_run_seed, spawn_key=(zlib.crc32(name.encode()), index))
+
+def make_rng(name):
+    return np.random.default_rng(seed_sequence(name))
+
+def seed_int(name):
+    # 31-bit integer seed for APIs that take one: env.seed, tf.random.Generator.from_seed, Keras initializers
+    return int(seed_sequence(name).generate_state(1)[0] >> 1)
@@ -0,0 +1,138 @@
+"""
+    Parallel hyperparameter sweeps, the replacement for running scan.ps1 line by line.
+        python sweep.py --Algos=TD3,DDPG --ActorNN=32,64,128 --CriticNN=32,64,128 --Seeds=0,1,2 --Workers=8 --Threads=1
+    Every configuration trains in its own process with TensorFlow limited to --Threads threads, and is saved to
+    models/<Algo>-<problem>/NoX like a single run. Pool workers cannot start processes, so the --NumEnvs lanes of
+    a run are stepped inside its worker. Configurations that already have a saved run (matched through
+    its config.json) are skipped, and runs that were stopped with a checkpoint continue from it, so re-running an
+    interrupted sweep resumes it.
+"""
+
+import os
+import json
+import time
+import multiprocessing as mp
+from contextlib import redirect_stdout
+from itertools import product
+from getopt import getopt
+from sys import argv
+
+from workers import init_worker
+
+# Fields that decide what a run computes, rendering and the output folder do not
+key_fields = ('algo', 'actor_nn', 'critic_nn', 'seed', 'problem', 'num_envs', 'use_async', 'num_actors',
+              'utd', 'super_batch', 'buffer', 'total_episodes')
+
+def run_key(config):
+    return tuple(config.get(field) for field in key_fields)
+
+def finished_runs(model_dir):
+    # Keys of every saved run under <model_dir>/<Algo>-<problem>/NoX
+    keys = set()
+    if not os.path.isdir(model_dir):
+        return keys
+    for name in os.listdir(model_dir):
+        if not os.path.isdir(os.path.join(model_dir, name)):
+            continue
+        for run in os.listdir(os.path.join(model_dir, name)):
+            path = os.path.join(model_dir, name, run, 'config.json')
+            if os.path.exists(path):
+                with open(path) as f:
+                    keys.add(run_key(json.load(f)))
+    return keys
+
+def unfinished_runs(model_dir):
+    # Run folder by key of every run that has a checkpoint but was never saved as finished
+    runs = {}
+    if not os.path.isdir(model_dir):
+        return runs
+    for name in os.listdir(model_dir):
+        if not os.path.isdir(os.path.join(model_dir, name)):
+            continue
+        for run in os.listdir(os.path.join(model_dir, name)):
+            path = os.path.join(model_dir, name, run)
+            if os.path.exists(os.path.join(path, 'checkpoint', 'checkpoint.json')) and not os.path.exists(os.path.join(path, 'config.json')):
+                with open(os.path.join(path, 'checkpoint', 'config.json')) as f:
+                    runs[run_key(json.load(f))] = path
+    return runs
+
+def grid(algos, actor_sizes, critic_sizes, seeds, **common):
+    # Fixed order: algorithm, actor size, critic size, seed
+    return [dict(algo=algo, actor_nn=actor_nn, critic_nn=critic_nn, seed=seed, **common)
+            for algo, actor_nn, critic_nn, seed in product(algos, actor_sizes, critic_sizes, seeds)]
+
+def _run(kwargs):
+    from config import TrainConfig
+    from training import train
+    config = TrainConfig(**kwargs)
+    log_dir = os.path.join(config.model_dir, 'sweep-logs')
+    os.makedirs(log_dir, exist_ok=True)
+    log = os.path.join(log_dir, '{}-{}-A{}-C{}-s{}.log'.format(config.algo, config.problem, config.actor_nn, config.critic_nn, config.seed))
+
+    start = time.perf_counter()
+    try:
+        # Appended to, so a run resumed from a checkpoint continues its log
+        with open(log, 'a') as f, redirect_stdout(f):
+            path = train(config)
+        return kwargs, path, time.perf_counter() - start, None
+    # SystemExit would end the worker without a result and leave the sweep waiting
+    except (Exception, SystemExit) as e:
+        return kwargs, None, time.perf_counter() - start, repr(e)
+
+def sweep(configs, workers=None, threads=1):
+    """
+        Train every config dict (TrainConfig keyword arguments) that has no saved run yet, 'workers' at a time.
+        Returns the number of runs that failed.
+    """
+    from config import TrainConfig
+    workers = workers or max(1, os.cpu_count() // threads)
+
+    done, unfinished, pending = {}, {}, []
+    failed = 0
+    for kwargs in configs:
+        # Invalid configurations fail here instead of in a worker
+        try:
+            config = TrainConfig(**kwargs)
+        except ValueError as e:
+            print('{} A{} C{} seed {} -> {}'.format(kwargs['algo'], kwargs['actor_nn'], kwargs['critic_nn'], kwargs['seed'], repr(e)))
+            failed += 1
+            continue
+        if config.model_dir not in done:
+            done[config.model_dir] = finished_runs(config.model_dir)
+            unfinished[config.model_dir] = unfinished_runs(config.model_dir)
+        key = run_key(config.to_dict())
+        if key not in done[config.model_dir]:
+            # Continue from the checkpoint of an interrupted run of the same configuration
+            resume = unfinished[config.model_dir].get(key)
+            pending.append(dict(kwargs, resume=resume) if resume else kwargs)
+    print('{} configurations, {} already finished, {} to run ({} from a checkpoint) on {} workers x {} threads'.format(
+        len(configs), len(configs) - len(pending) - failed, len(pending), sum('resume' in kwargs for kwargs in pending), workers, threads))
+
+    # A fresh process per run, so thread limits, seeds and Keras state never leak between runs
+    pool = mp.get_context('spawn').Pool(workers, init_worker, (threads,), maxtasksperchild=1)
+    try:
+        for i, (kwargs, path, seconds, error) in enumerate(pool.imap_unordered(_run, pending), 1):
+            name = '{} A{} C{} seed {}'.format(kwargs['algo'], kwargs['actor_nn'], kwargs['critic_nn'], kwargs['seed'])
+            print('[{}/{}] {} -> {} ({:.0f}s)'.format(i, len(pending), name, error or path, seconds))
+            failed += error is not None
+        pool.close()
+    except KeyboardInterrupt:
+        print('Interrupted, unfinished runs are not saved and continue from their last checkpoint on the next sweep')
+        pool.terminate()
+        raise SystemExit(1)
+    finally:
+        pool.join()
+    return failed
+
+if __name__ == '__main__':
+    opt, args = getopt(argv[1:], "", ["Algos=", "ActorNN=", "CriticNN=", "Seeds=", "Workers=", "Threads=", "Episodes=", "NumEnvs=", "ModelDir=", "Render=", "Problem="])
+    opt = dict(opt)
+    ints = lambda key, default: [int(value) for value in opt.get(key, default).split(',')]
+
+    common = dict(total_episodes=int(opt.get('--Episodes', 2_000)), num_envs=int(opt.get('--NumEnvs', 1)),
+                  model_dir=opt.get('--ModelDir', 'models'), render=int(opt.get('--Render', 0)))
+    if '--Problem' in opt: common['problem'] = opt['--Problem']
+    configs = grid(opt.get('--Algos', 'TD3,DDPG').split(','), ints('--ActorNN', '32'), ints('--CriticNN', '32'),
+                   ints('--Seeds', '0'), **common)
+    workers = int(opt['--Workers']) if '--Workers' in opt else None
+    raise SystemExit(sweep(configs, workers, int(opt.get('--Threads', 1))) > 0)
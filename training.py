@@ -0,0 +1,315 @@
+"""
+    One training run: train(config) builds the environments and the algorithm a TrainConfig describes, runs the
+    synchronous loop (or the asynchronous one of pipeline.py) with checkpoints, metrics and profiling, and saves
+    the trained networks to the run folder.
+"""
+
+from ECE239AS_Envs import make_vec_env
+from algorithms import Bounds, OUActionNoise, algorithm_types
+from buffers import MemmapBuffer, buffer_types
+from config import envs_pyb
+from pipeline import AsyncTrainer
+from logger import setup_logging
+from checkpoint import Checkpointer
+from metrics import MetricsLog
+from seeding import seed_int, set_run_seed, new_seed
+from profiling import profiler, format_report, ProfileLog, TraceWindow
+
+import os
+import json
+import time
+import signal
+import logging
+import threading
+from functools import partial
+
+import tensorflow as tf
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+def make_run_dir(model_dir, name):
+    # Unique folder model_dir/name/NoX for one run, mkdir fails if a parallel run took the number first
+    os.makedirs(f'{model_dir}/{name}', exist_ok=True)
+    for i in range(1, 100000):
+        path = f'{model_dir}/{name}/No{i}'
+        try:
+            os.mkdir(path)
+            return path
+        except FileExistsError:
+            pass
+
+def get_env_details(env):
+    num_states = env.observation_space.shape[0]
+    print("Size of State Space ->  {}".format(num_states))
+    num_actions = env.action_space.shape[0]
+    print("Size of Action Space ->  {}".format(num_actions))
+
+    upper_bound = +1.0 #env.action_space.high[0]
+    lower_bound = -1.0 #env.action_space.low[0]
+
+    print("Max Value of Action ->  {}".format(upper_bound))
+    print("Min Value of Action ->  {}".format(lower_bound))
+
+    return num_states, num_actions, lower_bound, upper_bound
+
+def train(config):
+    """
+        Run one training session described by 'config', then save it under config.model_dir.
+        Returns the saved run folder, or None if the run was preempted (SIGTERM), its checkpoint is kept for --Resume.
+    """
+    problem = config.problem
+    AlgoName = config.algo
+    num_envs = config.num_envs
+    utd = config.utd
+    super_batch = config.super_batch
+
+    # Every run has a seed, drawn here if none was given and saved with the config so the run can be repeated.
+    # Each component draws from its own stream of it, see seeding.py
+    if config.seed is None:
+        config.seed = new_seed()
+    set_run_seed(config.seed)
+    # Keras initializers, and Python's and NumPy's global state
+    tf.keras.utils.set_random_seed(seed_int('keras'))
+    log_handler = setup_logging(logging.DEBUG if config.verbose else logging.INFO, config.log_interval)
+
+    # The run folder exists from the start, checkpoints go to <path>/checkpoint and the final save into <path>
+    path = config.resume or make_run_dir(config.model_dir, f'{AlgoName}-{problem}')
+
+    buffer_cls = buffer_types[config.buffer]
+    if buffer_cls is MemmapBuffer:
+        # Replay files of their own for every run, a shared --ReplayDir is reopened on purpose
+        buffer_cls = partial(MemmapBuffer, directory=config.replay_dir or f'{path}/replay')
+
+    envs = [make_vec_env(problem, num_envs) for _ in range(config.num_actors)]
+    env = envs[0]
+    env_seed = seed_int('env')
+    for i, actor_envs in enumerate(envs):
+        actor_envs.seed(env_seed + i * num_envs)
+    num_states, num_actions, lower_bound, upper_bound = get_env_details(env)
+    # num_states *= 2
+
+    # Construct noise object, one OU process per environment lane
+    std_dev = 0.5 #1.5
+    min_std_dev = 0.01
+    ou_noises = [OUActionNoise(mean=np.zeros((num_envs, num_actions)), std_deviation=float(std_dev) * np.ones(1), decay=0.98, min_std_dev=min_std_dev)
+                 for _ in range(config.num_actors)]
+    ou_noise = ou_noises[0]
+
+    # Instantiate Algorithm object
+    action_bounds = Bounds(lower_bound, upper_bound)
+    _algo_cls = algorithm_types[AlgoName]
+    algo_kwargs = dict(buffer_cls=buffer_cls, actor_units=config.actor_nn, critic_units=config.critic_nn)
+    if AlgoName == "HIRO": algo_kwargs['num_envs'] = num_envs
+    algo = _algo_cls(num_states, num_actions, action_bounds, actor_lr=0.005, critic_lr=0.01, gamma=0.99, tau=0.005, **algo_kwargs)
+    # Compile the learn step with XLA
+    if config.jit: algo.compile_learner(jit_compile=True)
+
+    # if AlgoName == "HIRO":
+    #     algo.pretrain(env, ou_noise)
+    # raise SystemExit
+
+    total_episodes = config.total_episodes
+
+    # Finished episodes, and gradient updates owed to the data collected so far
+    ep = 0
+    update_credit = 0.0
+    # Episode number each lane is in, episodes are seeded from it
+    lane_episodes = np.zeros(num_envs, dtype=int)
+
+    checkpointer = None
+    if config.checkpoint_every or config.resume:
+        checkpointer = Checkpointer(f'{path}/checkpoint', algo)
+        if not config.resume:
+            with open(f'{path}/checkpoint/config.json', 'w') as f:
+                json.dump(config.to_dict(), f, indent=1)
+    # One row per episode with the rolling average reward over the last 40, streamed to <path>/metrics
+    metrics = MetricsLog(f'{path}/metrics')
+
+    # Training loop state that is not part of the algorithm
+    def progress():
+        return {'episode': ep, 'update_credit': update_credit, 'metrics': metrics.get_state(),
+                'noises': [noise.get_state() for noise in ou_noises], 'lane_episodes': lane_episodes.copy()}
+
+    if config.resume:
+        restored = checkpointer.restore()
+        ep, update_credit = restored['episode'], restored['update_credit']
+        metrics.set_state(restored['metrics'])
+        for noise, state in zip(ou_noises, restored['noises']):
+            noise.set_state(state)
+        # Environments cannot be checkpointed, every lane restarts the episode it was in from that episode's seed.
+        # Async lanes are not tracked, they continue with episode numbers none of them has used yet
+        lane_episodes[:] = ep if config.use_async else restored.get('lane_episodes', ep)
+        for i, actor_envs in enumerate(envs):
+            actor_envs.seed(env_seed + i * num_envs, lane_episodes)
+        logger.info('Resumed %s at episode %d', path, ep)
+    last_checkpoint = ep
+
+    def maybe_checkpoint():
+        nonlocal last_checkpoint
+        if config.checkpoint_every and ep - last_checkpoint >= config.checkpoint_every:
+            checkpointer.save(progress())
+            last_checkpoint = ep
+
+    # Spot preemption sends SIGTERM: stop between steps and keep a checkpoint instead of saving an unfinished run
+    preempted = threading.Event()
+    trainer = None
+    def on_sigterm(signum, frame):
+        preempted.set()
+        if trainer is not None: trainer.stop.set()
+    previous_sigterm = None
+    if checkpointer is not None and threading.current_thread() is threading.main_thread():
+        previous_sigterm = signal.signal(signal.SIGTERM, on_sigterm)
+
+    # Number of times learn has been traced, should stop growing after the first episodes
+    trace_count = 0
+    def report_retraces():
+        nonlocal trace_count
+        if algo.trace_count != trace_count:
+            trace_count = algo.trace_count
+            logger.info('    [learn traced %d times]', trace_count)
+
+    # Stage timings to the log and <path>/profile.jsonl every 'profile_every' episodes, see profiling.py
+    profile_log = None
+    if config.profile_every:
+        profile_log = ProfileLog(f'{path}/profile.jsonl')
+        profiler.enable()
+    trace = TraceWindow(f'{path}/trace', *config.trace) if config.trace else None
+    last_profile = ep
+
+    def maybe_profile():
+        nonlocal last_profile
+        if trace is not None: trace.update(ep)
+        if profile_log is not None and ep - last_profile >= config.profile_every:
+            report = profiler.report()
+            profile_log.append(ep, report)
+            for line in format_report(report):
+                logger.info(line)
+            last_profile = ep
+
+    def on_async_episode(episode, episodic_reward, length, noise_std):
+        nonlocal ep
+        avg_reward = metrics.append(episode, episodic_reward, length, lo_noise=float(np.mean(noise_std)))
+        logger.info('\t %4s : %s E_%d R_%5s. Move/%d', round(episodic_reward,2), noise_std, episode, np.round(avg_reward,2), length)
+        report_retraces()
+        ep = episode + 1
+        if checkpointer is not None: maybe_checkpoint()
+        maybe_profile()
+
+    try:
+        maybe_profile()
+        if config.use_async:
+            trainer = AsyncTrainer(algo, envs, ou_noises, utd=utd, super_batch=super_batch)
+            trainer.num_episodes = ep
+            trainer.run(total_episodes, on_async_episode)
+        else:
+            if config.render and problem in envs_pyb: env.render()
+            prev_states = env.reset()
+            # Episodes finish independently in every lane
+            episodic_rewards = np.zeros(num_envs)
+            # Per-lane step count and sums of the actions and their magnitudes, for the episode summary
+            lengths = np.zeros(num_envs, dtype=int)
+            move_sums = np.zeros(num_envs)
+            move_mags = np.zeros(num_envs)
+            episode_starts = np.full(num_envs, time.perf_counter())
+
+            # Takes about 4 min to train
+            while ep < total_episodes and not preempted.is_set():
+                pretrain = ep < 500
+
+                # Uncomment this to see the Actor in action
+                # But not in a python notebook.
+                if config.render and ep % config.render == 0: env.render()
+                # env.render()
+
+                # Get moves for every lane from algorithm
+                with profiler.stage('policy'):
+                    actions = algo.policy_batch(prev_states, ou_noise, pretrain)
+
+                # Interact with environments and record experience
+                with profiler.stage('env.step'):
+                    states, rewards, dones, infos = env.step(actions)
+                profiler.count('env_steps', num_envs)
+                # Finished lanes were already reset, record their true final state
+                final_states = np.array(states)
+                for i in np.flatnonzero(dones):
+                    final_states[i] = infos[i]['terminal_observation']
+                with profiler.stage('record'):
+                    algo.record_batch(prev_states, actions, rewards, final_states, dones)
+                episodic_rewards += rewards
+                prev_states = states
+
+                # Offline Experience Replay
+                update_credit += utd * num_envs
+                while update_credit >= super_batch:
+                    with profiler.stage('train'):
+                        algo.train() if super_batch == 1 else algo.train_many(super_batch)
+                    profiler.count('updates', super_batch)
+                    update_credit -= super_batch
+
+                lengths += 1
+                move_sums += actions[:, 0]
+                move_mags += np.abs(actions[:, 0])
+                for i in np.flatnonzero(dones):
+                    # Environment steps per second over this episode, all lanes together
+                    now = time.perf_counter()
+                    steps_per_sec = lengths[i] * num_envs / max(now - episode_starts[i], 1e-9)
+                    episode_starts[i] = now
+                    move, move_mag = move_sums[i] / lengths[i], move_mags[i] / lengths[i]
+                    if AlgoName == "HIRO":
+                        lo_noise, hi_noise = float(np.mean(algo.lo_noise.std_dev)), float(np.mean(algo.hi_noise.std_dev))
+                    else:
+                        lo_noise, hi_noise = float(np.mean(ou_noise.std_dev)), np.nan
+                    avg_reward = metrics.append(ep, episodic_rewards[i], lengths[i], move, move_mag, lo_noise, hi_noise, steps_per_sec)
+                    logger.info('\t %s %4s : %s E_%d R_%5s. Move/%d %5s with mag %5s  %6.0f steps/s',
+                                "PRETRAIN" if pretrain and AlgoName == "HIRO" else "",
+                                round(episodic_rewards[i],2),
+                                "{}/{}".format(np.round(algo.lo_noise.std_dev, 2), np.round(algo.hi_noise.std_dev, 2)) if AlgoName == "HIRO" else np.round(ou_noise.std_dev,2),
+                                ep, np.round(avg_reward,2), lengths[i], round(move,2), round(move_mag,2),
+                                steps_per_sec)
+                    report_retraces()
+
+                    # Decrease noise
+                    ou_noise.end_episodes([i])
+
+                    episodic_rewards[i] = 0
+                    lengths[i] = 0
+                    lane_episodes[i] += 1
+                    move_sums[i] = 0
+                    move_mags[i] = 0
+                    ep += 1
+                    if config.render and problem in envs_pyb and i == 0: env.render()
+
+                if checkpointer is not None: maybe_checkpoint()
+                maybe_profile()
+
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if previous_sigterm is not None:
+            signal.signal(signal.SIGTERM, previous_sigterm)
+        if trace is not None: trace.close()
+        if profile_log is not None:
+            profiler.disable()
+            profile_log.close()
+    for env in envs:
+        env.close()
+    metrics.flush()
+
+    if checkpointer is not None:
+        if preempted.is_set():
+            checkpointer.save(progress())
+        checkpointer.close()
+    if preempted.is_set():
+        logger.warning('Preempted at episode %d, continue with --Resume=%s', ep, path)
+        metrics.close()
+        log_handler.flush()
+        return None
+    metrics.close()
+    log_handler.flush()
+
+    # Save model to the run folder, with the config that produced it
+    algo.save(path)
+    with open(f'{path}/config.json', 'w') as f:
+        json.dump(config.to_dict(), f, indent=1)
+    return path
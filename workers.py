@@ -0,0 +1,17 @@
+"""
+    Setup of the pool processes that sweep.py and evaluate.py run their jobs in. Pools are spawned and their
+    workers import this module first, so it loads nothing heavy before init_worker runs.
+"""
+
+import os
+import signal
+
+def init_worker(threads):
+    # Ctrl-C is handled by the parent, an interrupted run must not save itself as finished
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    # Thread pools can only be sized before TensorFlow runs its first op
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(threads)
+    tf.config.experimental.enable_op_determinism()